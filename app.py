@@ -1,16 +1,18 @@
+import os
 import streamlit as st
 from datetime import datetime
-import time
-from real_time_data_extraction import (
-    init_spotify_client, 
-    fetch_top_tracks, 
-    process_spotify_data,
-    upload_to_hopsworks    
-)
-from recommendation import get_recommendations
+from pipeline import Pipeline
+from connections import get_spotify_client, get_user_profile
+from metrics import profiled, start_metrics_file_writer, start_metrics_server, timed
 from dotenv import load_dotenv
 load_dotenv()
 
+# Export hot-path metrics in Prometheus format if configured (once per process)
+if os.getenv("METRICS_PORT"):
+    start_metrics_server(int(os.getenv("METRICS_PORT")))
+if os.getenv("METRICS_FILE"):
+    start_metrics_file_writer(os.getenv("METRICS_FILE"))
+
 # Page configuration
 st.set_page_config(
     page_title="Spotify Music Recommendation System",
@@ -51,6 +53,10 @@ if 'progress' not in st.session_state:
     st.session_state.progress = ""
 if 'processing' not in st.session_state:
     st.session_state.processing = False
+if 'upload' not in st.session_state:
+    st.session_state.upload = None
+if 'stage_timings' not in st.session_state:
+    st.session_state.stage_timings = {}
 
 # Header
 st.markdown('<div class="header"><h1>🎵 Spotify Music Recommendation System</h1></div>', unsafe_allow_html=True)
@@ -75,6 +81,7 @@ with right_col:
     st.subheader("Actions")
     analyze_button = st.button("Get Recommendations", type="primary", use_container_width=True)
     create_playlist_button = st.button("Create Playlist", type="secondary", use_container_width=True)
+    n_recommendations = st.slider("Number of recommendations", min_value=10, max_value=100, value=10, step=10)
     st.markdown('</div>', unsafe_allow_html=True)
     
     # Show user profile if connected
@@ -82,7 +89,7 @@ with right_col:
         try:
             st.markdown('<div class="card">', unsafe_allow_html=True)
             st.subheader("Your Profile")
-            user = st.session_state.spotify_client.current_user()
+            user = get_user_profile(st.session_state.spotify_client)
             if 'images' in user and len(user['images']) > 0:
                 st.image(user['images'][0]['url'], width=100)
             st.write(f"**{user['display_name']}**")
@@ -110,105 +117,90 @@ with left_col:
         recs_df.index = range(1, len(recs_df) + 1)  # 1-based indexing
         st.table(recs_df)
         
+        # Background upload status and per-stage timings from the last run
+        upload = st.session_state.upload
+        if upload is not None:
+            if not upload.done():
+                st.caption("💾 Saving your tracks to Hopsworks in the background...")
+            elif upload.exception() is not None:
+                st.caption(f"❌ Upload to Hopsworks failed: {upload.exception()}")
+            else:
+                st.caption(f"✅ {upload.result()}")
+        if st.session_state.stage_timings:
+            st.caption(" · ".join(f"{stage}: {elapsed:.2f}s" for stage, elapsed in st.session_state.stage_timings.items()))
+        
         st.markdown('</div>', unsafe_allow_html=True)
 
-# Functions (unchanged)
+# Functions
+STAGE_ICONS = {"started": "⏳", "finished": "✅", "failed": "❌"}
+
+def format_event(event):
+    line = f"{STAGE_ICONS[event.status]} {event.stage}"
+    if event.elapsed is not None:
+        line += f" ({event.elapsed:.2f}s)"
+    if event.message:
+        line += f": {event.message}"
+    return line
+
 def process_user_data():
     st.session_state.processing = True
-    log = ""
-    
-    # Step 1: Initialize Spotify client
-    log += "🎵 Step 1: Initializing Spotify client...\n"
-    message_placeholder.markdown(f"""<div class="card">
-    <h3>Processing</h3>
-    <pre>{log}</pre>
-    </div>""", unsafe_allow_html=True)
-    
+    log_lines = []
+
+    with message_placeholder.container():
+        status = st.status("Processing", expanded=True)
+
+    # Each event is appended to the status box instead of re-rendering the whole log
+    def log(line):
+        log_lines.append(line)
+        status.write(line)
+
+    pipeline = Pipeline(on_event=lambda event: log(format_event(event)))
+
     try:
-        st.session_state.spotify_client = init_spotify_client()
-        time.sleep(1)  # Small delay for UI feedback
-        
-        # Step 2: Fetch top tracks
-        log += "📊 Step 2: Fetching your top tracks from Spotify...\n"
-        message_placeholder.markdown(f"""<div class="card">
-        <h3>Processing</h3>
-        <pre>{log}</pre>
-        </div>""", unsafe_allow_html=True)
-        
-        top_tracks = fetch_top_tracks(st.session_state.spotify_client, limit=10, time_range="short_term")
-        time.sleep(1)
-        
-        # Display top tracks
-        log += "\n🎧 Your Top 10 Recent Tracks:\n"
-        log += "━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━\n"
-        for i, track in enumerate(top_tracks, 1):
-            track_name = track["name"]
+        # Imported on first use so the page renders without loading pandas, sklearn or hopsworks
+        from real_time_data_extraction import process_spotify_data, upload_to_hopsworks
+        from top_tracks import fetch_seed_tracks
+        if os.getenv("RECOMMENDER_URL"):
+            # A separate recommendation_service.py process holds the model
+            from recommendation_client import get_recommendations
+        else:
+            from recommendation import get_recommendations
+
+        st.session_state.spotify_client = pipeline.run_stage("Initializing Spotify client", get_spotify_client)
+        user_id = get_user_profile(st.session_state.spotify_client)["id"]
+        top_tracks = pipeline.run_stage(
+            "Fetching your top tracks from Spotify",
+            fetch_seed_tracks, st.session_state.spotify_client, user_id=user_id
+        )
+
+        # Display the strongest seeds
+        tracks_log = f"🎧 Your Top Tracks ({len(top_tracks)} seeds, top 10 shown):\n"
+        for i, track in enumerate(top_tracks[:10], 1):
             artists = ", ".join(artist["name"] for artist in track["artists"])
-            log += f"{i}. 🎵 {track_name}\n   👤 {artists}\n"
-        log += "━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━\n"
-        message_placeholder.markdown(f"""<div class="card">
-        <h3>Processing</h3>
-        <pre>{log}</pre>
-        </div>""", unsafe_allow_html=True)
-        time.sleep(1)
-        
-        # Step 3: Process data
-        log += "\n📝 Step 3: Processing data...\n"
-        message_placeholder.markdown(f"""<div class="card">
-        <h3>Processing</h3>
-        <pre>{log}</pre>
-        </div>""", unsafe_allow_html=True)
-        
-        df = process_spotify_data(top_tracks)
-        time.sleep(1)
-        
-        # Step 4: Upload to Hopsworks
-        log += "💾 Step 4: Uploading data to Hopsworks...\n"
-        message_placeholder.markdown(f"""<div class="card">
-        <h3>Processing</h3>
-        <pre>{log}</pre>
-        </div>""", unsafe_allow_html=True)
-        
-        result = upload_to_hopsworks(df)
-        log += f"✅ {result}\n"
-        message_placeholder.markdown(f"""<div class="card">
-        <h3>Processing</h3>
-        <pre>{log}</pre>
-        </div>""", unsafe_allow_html=True)
-        time.sleep(1)
-        
-        # Step 5: Get recommendations
-        log += "🎯 Step 5: Getting personalized recommendations...\n"
-        message_placeholder.markdown(f"""<div class="card">
-        <h3>Processing</h3>
-        <pre>{log}</pre>
-        </div>""", unsafe_allow_html=True)
-        
-        st.session_state.recommendations = get_recommendations(top_tracks)
-        log += "\n🌟 Recommended Songs:\n"
-        log += "━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━\n"
-        for i, (_, row) in enumerate(st.session_state.recommendations.iterrows(), 1):
-            log += f"{i}. 🎵 {row['track_name']}\n   👤 {row['artist_name']}\n"
-        log += "━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━\n"
-        log += "\n✨ Click 'Create Playlist' to save these recommendations to your Spotify account!\n"
-        message_placeholder.markdown(f"""<div class="card">
-        <h3>Processing</h3>
-        <pre>{log}</pre>
-        </div>""", unsafe_allow_html=True)
-        
-        st.session_state.progress = log
+            tracks_log += f"{i}. 🎵 {track['name']} — 👤 {artists}\n"
+        log(tracks_log)
+
+        df = pipeline.run_stage("Processing data", process_spotify_data, top_tracks)
+
+        # The upload doesn't feed the recommendations, so it runs off the critical path
+        st.session_state.upload = pipeline.run_background("Uploading data to Hopsworks", upload_to_hopsworks, df)
+
+        st.session_state.recommendations = pipeline.run_stage(
+            "Getting personalized recommendations", get_recommendations, top_tracks, n_recommendations
+        )
+        log("✨ Click 'Create Playlist' to save these recommendations to your Spotify account!")
+        status.update(label=f"Done in {sum(pipeline.timings.values()):.1f}s", state="complete")
+
+        st.session_state.progress = "\n".join(log_lines)
+        st.session_state.stage_timings = dict(pipeline.timings)
         st.session_state.processing = False
-        
+
         # Rerun to refresh the UI with recommendations
         st.experimental_rerun()
-        
+
     except Exception as e:
-        log += f"\n❌ Error: {str(e)}\n"
-        message_placeholder.markdown(f"""<div class="card">
-        <h3>Processing</h3>
-        <pre>{log}</pre>
-        </div>""", unsafe_allow_html=True)
-        st.session_state.progress = log
+        status.update(label=f"Error: {str(e)}", state="error")
+        st.session_state.progress = "\n".join(log_lines)
         st.session_state.processing = False
 
 def create_spotify_playlist():
@@ -217,43 +209,34 @@ def create_spotify_playlist():
         return
     
     try:
+        from playlist import resolve_track_uris, add_tracks_to_playlist
+
         with st.spinner("Creating playlist in Spotify..."):
             # Get the Spotify client and recommendations
             spotify_client = st.session_state.spotify_client
             recommendations = st.session_state.recommendations
             
             # Create a new playlist
-            user_profile = spotify_client.current_user()
+            user_profile = get_user_profile(spotify_client)
             user_id = user_profile["id"]
             
             playlist_name = f"Recommended Tracks {datetime.now().strftime('%Y-%m-%d')}"
             playlist_description = "Personalized recommendations based on your listening history"
             
-            playlist = spotify_client.user_playlist_create(
-                user=user_id,
-                name=playlist_name,
-                public=False,
-                description=playlist_description
-            )
+            with timed("spotify_playlist_create"):
+                playlist = spotify_client.user_playlist_create(
+                    user=user_id,
+                    name=playlist_name,
+                    public=False,
+                    description=playlist_description
+                )
             
-            # Search for each recommended track to get its URI
-            track_uris = []
-            for _, row in recommendations.iterrows():
-                track_name = row["track_name"]
-                artist_name = row["artist_name"]
-                
-                # Search for the track
-                query = f"track:{track_name} artist:{artist_name}"
-                search_results = spotify_client.search(q=query, type="track", limit=1)
-                
-                # If found, add to our list
-                if search_results["tracks"]["items"]:
-                    track_uri = search_results["tracks"]["items"][0]["uri"]
-                    track_uris.append(track_uri)
+            # Search for the recommended tracks' URIs concurrently
+            track_uris = resolve_track_uris(spotify_client, recommendations)
             
             # Add tracks to the playlist
             if track_uris:
-                spotify_client.playlist_add_items(playlist["id"], track_uris)
+                add_tracks_to_playlist(spotify_client, playlist["id"], track_uris)
                 result = {
                     "message": f"Created playlist '{playlist_name}' with {len(track_uris)} tracks!",
                     "url": playlist["external_urls"]["spotify"]
@@ -287,12 +270,17 @@ def create_spotify_playlist():
     except Exception as e:
         st.error(f"❌ Error creating playlist: {str(e)}")
 
-# Button actions (unchanged)
+# Button actions
+# Add ?profile=1 to the URL to save a profile of this request under ./profiles
+profile_request = st.query_params.get("profile") == "1"
+
 if analyze_button:
-    process_user_data()
+    with profiled("process_user_data", enabled=profile_request):
+        process_user_data()
 
 if create_playlist_button:
-    create_spotify_playlist()
+    with profiled("create_spotify_playlist", enabled=profile_request):
+        create_spotify_playlist()
 
 # Display progress (only if not actively processing and no recommendations yet)
 if st.session_state.progress and not st.session_state.processing and st.session_state.recommendations is None:
@@ -0,0 +1,145 @@
+import fcntl
+import hashlib
+import json
+import os
+import re
+import shutil
+import time
+from contextlib import contextmanager
+from knn_index import INDEX_DIR, load_index, save_index
+
+# Each build is published to INDEX_DIR/v0001, v0002, ... and CURRENT names the one to serve
+CURRENT_FILE = "CURRENT"
+MANIFEST_FILE = "manifest.json"
+# Held while a version is published or CURRENT is switched, by every process sharing root
+LOCK_FILE = ".publish.lock"
+# Versions kept on disk (besides the current one) for rollback and for processes still mapping them
+KEEP_VERSIONS = 3
+_VERSION_PATTERN = re.compile(r"^v(\d+)$")
+
+def _file_sha256(path, chunk_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def list_versions(root=INDEX_DIR):
+    """Published versions under root, oldest first."""
+    if not os.path.isdir(root):
+        return []
+    versions = [name for name in os.listdir(root) if _VERSION_PATTERN.match(name)]
+    return sorted(versions, key=lambda name: int(name[1:]))
+
+def current_version(root=INDEX_DIR):
+    """The version named by CURRENT, or None if nothing has been published."""
+    try:
+        with open(os.path.join(root, CURRENT_FILE)) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+@contextmanager
+def _publish_lock(root):
+    """Hold root's publish lock, so concurrent publishers (training runs, shard servers) take turns."""
+    os.makedirs(root, exist_ok=True)
+    with open(os.path.join(root, LOCK_FILE), "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def set_current(version, root=INDEX_DIR):
+    """Point CURRENT at a published version (also used to roll back)."""
+    with _publish_lock(root):
+        _set_current(version, root)
+
+def _set_current(version, root):
+    if not os.path.exists(os.path.join(root, version, MANIFEST_FILE)):
+        raise ValueError(f"Version {version} has not been published")
+    tmp_path = os.path.join(root, CURRENT_FILE + ".tmp")
+    with open(tmp_path, "w") as f:
+        f.write(version + "\n")
+    os.replace(tmp_path, os.path.join(root, CURRENT_FILE))
+
+def read_manifest(version, root=INDEX_DIR):
+    with open(os.path.join(root, version, MANIFEST_FILE)) as f:
+        return json.load(f)
+
+def verify_version(version, root=INDEX_DIR, checksums=True):
+    """Check a version's files against its manifest; returns a list of problems (empty if intact)."""
+    version_dir = os.path.join(root, version)
+    problems = []
+    for name, expected in read_manifest(version, root)["files"].items():
+        path = os.path.join(version_dir, name)
+        if not os.path.exists(path):
+            problems.append(f"{name} is missing")
+        elif os.path.getsize(path) != expected["bytes"]:
+            problems.append(f"{name} has {os.path.getsize(path)} bytes, expected {expected['bytes']}")
+        elif checksums and _file_sha256(path) != expected["sha256"]:
+            problems.append(f"{name} checksum mismatch")
+    return problems
+
+def publish_index(index, root=INDEX_DIR, keep=KEEP_VERSIONS):
+    """Save an index bundle as a new version with a checksummed manifest and make it current.
+
+    The bundle is written to a temporary directory and renamed into place before CURRENT is
+    switched, so readers only ever see complete versions. Publishers hold root's lock file from
+    choosing the version number to the switch, so concurrent processes never pick the same one.
+    Returns the new version name.
+    """
+    with _publish_lock(root):
+        published = list_versions(root)
+        version = f"v{int(published[-1][1:]) + 1 if published else 1:04d}"
+        tmp_dir = os.path.join(root, version + ".tmp")
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        save_index(index, tmp_dir)
+
+        files = {
+            name: {"bytes": os.path.getsize(os.path.join(tmp_dir, name)), "sha256": _file_sha256(os.path.join(tmp_dir, name))}
+            for name in sorted(os.listdir(tmp_dir))
+        }
+        manifest = {
+            "version": version,
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "format": index["format"],
+            "fg_version": index["fg_version"],
+            "backend": index["backend"],
+            "index_params": index.get("index_params", {}),
+            "content_hash": index["content_hash"],
+            "rows": len(index["catalog"]),
+            "files": files,
+        }
+        with open(os.path.join(tmp_dir, MANIFEST_FILE), "w") as f:
+            json.dump(manifest, f, indent=2)
+
+        os.replace(tmp_dir, os.path.join(root, version))
+        _set_current(version, root)
+        index["version"] = version
+
+        # Old versions are removed from disk; processes still mapping their files keep working
+        for old in list_versions(root)[:-(keep + 1)]:
+            shutil.rmtree(os.path.join(root, old), ignore_errors=True)
+    return version
+
+def load_version(version, root=INDEX_DIR, verify_checksums=False):
+    """Load a published version (memory-mapped), or None if it is missing or damaged."""
+    try:
+        problems = verify_version(version, root, checksums=verify_checksums)
+    except (FileNotFoundError, ValueError) as e:
+        problems = [str(e)]
+    if problems:
+        print(f"Ignoring index version {version}: {'; '.join(problems)}")
+        return None
+    index = load_index(os.path.join(root, version))
+    if index is not None:
+        index["version"] = version
+    return index
+
+def load_current_index(root=INDEX_DIR, verify_checksums=False):
+    """Load the current published version, falling back to an unversioned bundle saved directly in root."""
+    version = current_version(root)
+    if version is None:
+        return load_index(root)
+    return load_version(version, root, verify_checksums)
@@ -0,0 +1,249 @@
+import fcntl
+import json
+import os
+import threading
+from contextlib import contextmanager
+import numpy as np
+import pandas as pd
+from feature_pipeline import ARTIST_FEATURES
+from seed_lookup import _ARTIST_SEPARATOR
+
+ARTIST_COLUMNS = [
+    'artist_avg_popularity', 'artist_popularity_std', 'artist_track_count',
+    'artist_avg_acousticness', 'artist_avg_danceability', 'artist_avg_energy'
+]
+# Audio features with their own counts: tracks ingested without audio features still count for popularity
+AUDIO_STAT_FEATURES = list(ARTIST_FEATURES.values())
+STAT_FIELDS = ['popularity_count', 'popularity_sum', 'popularity_sumsq'] + [
+    f'{feature}_{stat}' for feature in AUDIO_STAT_FEATURES for stat in ('sum', 'count')
+]
+# Updates are appended to a log next to the snapshot and folded into it every this many lines
+COMPACT_EVERY = 10_000
+
+def artist_keys(artist_names):
+    """Statistics key of each joined artist string: its artists joined with ';'.
+
+    Catalog rows join artists with ';' and Spotify rows with ', ', so both forms of the same
+    artists map to one key.
+    """
+    names = pd.Series(np.asarray(artist_names, dtype=object), dtype=object)
+    return names.str.strip().str.replace(_ARTIST_SEPARATOR, ";", regex=True)
+
+class ArtistStats:
+    """Running per-artist count, sum and sum of squares of popularity plus audio feature sums.
+
+    Means, the sample std and the count for any artist come out in O(1), and adding a track is
+    O(1), so rows can get correct artist_* features at ingest time. Popularity is on Spotify's
+    raw 0-100 scale and audio features are unscaled, as in the notebook's create_features.
+    """
+
+    def __init__(self, names=(), values=None):
+        self._names = []
+        self._index = {}
+        self._values = np.zeros((max(len(names), 16), len(STAT_FIELDS)))
+        if values is not None and len(names):
+            # Names saved under an older key merge into their current key
+            rows = self._rows(list(names))
+            np.add.at(self._values, rows, values)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._names)
+
+    def _rows(self, names):
+        rows = np.empty(len(names), dtype=np.int64)
+        for i, name in enumerate(artist_keys(names)):
+            row = self._index.get(name)
+            if row is None:
+                row = self._index[name] = len(self._names)
+                self._names.append(name)
+            rows[i] = row
+        if len(self._names) > len(self._values):
+            grown = np.zeros((2 * len(self._names), len(STAT_FIELDS)))
+            grown[:len(self._values)] = self._values
+            self._values = grown
+        return rows
+
+    def add_summed(self, summed):
+        """Add per-artist sums: a frame indexed by artist name with the STAT_FIELDS columns."""
+        with self._lock:
+            rows = self._rows(list(summed.index))
+            np.add.at(self._values, rows, summed[STAT_FIELDS].to_numpy(dtype=np.float64))
+
+    def add(self, artist_names, popularity, audio=None):
+        """Add tracks; `audio` is an optional frame of raw acousticness/danceability/energy values."""
+        summed = summarize(artist_names, popularity, audio)
+        self.add_summed(summed)
+        return summed
+
+    def merge(self, other):
+        self.add_summed(other.to_frame())
+        return self
+
+    def to_frame(self):
+        with self._lock:
+            return pd.DataFrame(self._values[:len(self._names)].copy(), index=pd.Index(self._names), columns=STAT_FIELDS)
+
+    def lookup(self, artist_names, pending=None):
+        """artist_* feature columns for each name, with 0 for unknown artists (like the notebook's fillna).
+
+        `pending` is a summarize() frame of tracks counted on top of the stored ones without
+        adding them, e.g. rows that aren't inserted yet.
+        """
+        keys = artist_keys(artist_names)
+        with self._lock:
+            rows = np.array([self._index.get(name, -1) for name in keys], dtype=np.int64)
+            values = np.where((rows >= 0)[:, None], self._values[np.maximum(rows, 0)], 0.0)
+        if pending is not None:
+            values = values + pending.reindex(keys.to_numpy())[STAT_FIELDS].fillna(0).to_numpy()
+        stats = pd.DataFrame(values, columns=STAT_FIELDS)
+        count = stats['popularity_count']
+        with np.errstate(divide='ignore', invalid='ignore'):
+            mean = stats['popularity_sum'] / count
+            # Sample standard deviation, undefined (0) for a single track
+            variance = (stats['popularity_sumsq'] - count * mean ** 2) / (count - 1)
+            features = pd.DataFrame({
+                'artist_avg_popularity': mean,
+                'artist_popularity_std': np.sqrt(variance.clip(lower=0)).where(count > 1),
+                'artist_track_count': count.astype(np.int64),
+            })
+            for column, feature in ARTIST_FEATURES.items():
+                features[column] = stats[f'{feature}_sum'] / stats[f'{feature}_count']
+        return features[ARTIST_COLUMNS].fillna(0)
+
+    def save(self, path, generation=0):
+        """Write a compact snapshot: names as one NUL-separated UTF-8 blob plus a float64 matrix."""
+        frame = self.to_frame()
+        names = np.frombuffer("\0".join(frame.index).encode(), dtype=np.uint8)
+        tmp_path = path + ".tmp.npz"
+        np.savez_compressed(tmp_path, names=names, values=frame.to_numpy(), generation=generation)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        """Load a snapshot; returns the stats and the snapshot's generation."""
+        with np.load(path) as data:
+            blob = data['names'].tobytes().decode()
+            values = data['values']
+            generation = int(data['generation'])
+        names = blob.split("\0") if len(values) else []
+        return cls(names, values), generation
+
+def summarize(artist_names, popularity, audio=None):
+    """Per-artist sums of a batch of tracks, ready for ArtistStats.add_summed."""
+    popularity = pd.Series(np.asarray(popularity, dtype=np.float64))
+    stats = pd.DataFrame({
+        'artist_name': artist_keys(artist_names).to_numpy(),
+        'popularity_count': popularity.notna().astype(np.int64),
+        'popularity_sum': popularity.fillna(0),
+        'popularity_sumsq': popularity.fillna(0) ** 2,
+    })
+    for feature in AUDIO_STAT_FEATURES:
+        values = audio[feature].reset_index(drop=True) if audio is not None else pd.Series(np.nan, index=stats.index)
+        stats[f'{feature}_sum'] = values.fillna(0).to_numpy()
+        stats[f'{feature}_count'] = values.notna().astype(np.int64).to_numpy()
+    return stats[stats['artist_name'].notna()].groupby('artist_name')[STAT_FIELDS].sum()
+
+class ArtistStatsStore:
+    """An ArtistStats persisted as a snapshot plus an append-only log of updates.
+
+    Each snapshot has a generation and only the log of that generation is replayed on load, so
+    a crash while compacting never applies an update twice. Every process using the same path
+    holds its lock file while reading or changing the files, and first catches up on what the
+    others wrote (log lines, or a newer snapshot), so no update is lost or counted twice.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self.stats, self.generation = ArtistStats(), 0
+        # Which snapshot file self.stats was loaded from, and how far its log has been replayed
+        self._snapshot_id = None
+        self._log_offset = 0
+        self._log_lines = 0
+        with self._lock, self._locked(shared=True):
+            self._sync()
+
+    @contextmanager
+    def _locked(self, shared=False):
+        """Hold the store's lock file: shared for reads, exclusive for changes."""
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.path + ".lock", "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _log_path(self):
+        return f"{self.path}.{self.generation}.log"
+
+    def _sync(self):
+        """Reload if another process wrote a newer snapshot, then replay log lines appended since the last sync."""
+        try:
+            stat = os.stat(self.path)
+            snapshot_id = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        except FileNotFoundError:
+            snapshot_id = None
+        if snapshot_id != self._snapshot_id:
+            self.stats, self.generation = ArtistStats.load(self.path) if snapshot_id else (ArtistStats(), 0)
+            self._snapshot_id = snapshot_id
+            self._log_offset = self._log_lines = 0
+
+        if not os.path.exists(self._log_path()):
+            return
+        with open(self._log_path(), "rb") as f:
+            f.seek(self._log_offset)
+            data = f.read()
+        self._log_offset += len(data)
+        entries = [json.loads(line) for line in data.decode().splitlines() if line.strip()]
+        if entries:
+            self.stats.add_summed(pd.DataFrame([entry[1:] for entry in entries],
+                                               index=[entry[0] for entry in entries], columns=STAT_FIELDS))
+        self._log_lines += len(entries)
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def lookup(self, artist_names, pending=None):
+        with self._lock, self._locked(shared=True):
+            self._sync()
+            return self.stats.lookup(artist_names, pending)
+
+    def add(self, artist_names, popularity, audio=None):
+        """Add tracks and append the per-artist deltas to the log."""
+        with self._lock, self._locked():
+            self._sync()
+            summed = self.stats.add(artist_names, popularity, audio)
+            lines = "".join(
+                json.dumps([name, *map(float, values)]) + "\n" for name, values in zip(summed.index, summed.to_numpy())
+            )
+            with open(self._log_path(), "ab") as f:
+                f.write(lines.encode())
+                self._log_offset = f.tell()
+            self._log_lines += len(summed)
+            if self._log_lines >= COMPACT_EVERY:
+                self._save()
+
+    def _save(self):
+        old_log = self._log_path()
+        self.stats.save(self.path, self.generation + 1)
+        self.generation += 1
+        stat = os.stat(self.path)
+        self._snapshot_id = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        self._log_offset = self._log_lines = 0
+        if os.path.exists(old_log):
+            os.remove(old_log)
+
+    def save(self):
+        """Fold the log into a new snapshot."""
+        with self._lock, self._locked():
+            self._sync()
+            self._save()
+
+    def replace(self, stats):
+        """Swap in freshly computed stats (e.g. from a catalog rebuild) and persist them."""
+        with self._lock, self._locked():
+            self._sync()
+            self.stats = stats
+            self._save()
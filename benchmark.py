@@ -0,0 +1,191 @@
+import argparse
+import json
+import multiprocessing
+import resource
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+
+DEFAULT_SIZES = [10_000, 100_000, 1_000_000, 5_000_000]
+SEEDS_PER_USER = 10
+
+def synthetic_catalog(n_rows, seed=0):
+    """A catalog shaped like recommender_spotify, with the columns process_spotify_data produces."""
+    rng = np.random.default_rng(seed)
+    n_artists = max(1, n_rows // 10)
+    artist_ids = rng.integers(0, n_artists, n_rows)
+    popularity = rng.integers(0, 100, n_rows)
+
+    df = pd.DataFrame({
+        "track_id": [f"{i:022d}" for i in range(n_rows)],
+        "track_name": [f"Track {i}" for i in range(n_rows)],
+        "artist_name": pd.Categorical.from_codes(artist_ids, [f"Artist {i}" for i in range(n_artists)]).astype(str),
+        "popularity": popularity / 100.0,
+        "album_name": "unknown_album",
+        "duration_ms": rng.integers(60_000, 400_000, n_rows),
+        "key": rng.integers(0, 12, n_rows),
+        "mode": rng.integers(0, 2, n_rows),
+        "time_signature": rng.integers(3, 6, n_rows),
+        "track_genre": "unknown",
+    })
+    # Audio features are stored standardized, as create_features leaves them
+    for col in ["acousticness", "danceability", "energy", "instrumentalness",
+                "liveness", "tempo", "loudness", "speechiness"]:
+        df[col] = rng.standard_normal(n_rows).astype(np.float32)
+
+    per_artist = pd.DataFrame({"artist": artist_ids, "popularity": popularity}).groupby("artist")["popularity"]
+    df["artist_avg_popularity"] = per_artist.transform("mean").to_numpy()
+    df["artist_popularity_std"] = per_artist.transform("std").fillna(0).to_numpy()
+    df["artist_track_count"] = per_artist.transform("count").to_numpy()
+    for col in ["artist_avg_acousticness", "artist_avg_danceability", "artist_avg_energy"]:
+        df[col] = rng.random(n_artists)[artist_ids]
+    df["duration_minutes"] = df["duration_ms"] / 60000
+    return df
+
+def _seed_tracks(catalog, rng, n_seeds):
+    rows = rng.choice(len(catalog), size=n_seeds, replace=False)
+    return [
+        {"id": track_id, "name": name, "artists": [{"name": artist}]}
+        for track_id, name, artist in catalog.iloc[rows][["track_id", "track_name", "artist_name"]].itertuples(index=False)
+    ]
+
+def _timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return time.perf_counter() - start, result
+
+def _summary(samples):
+    samples = np.asarray(samples) * 1000
+    return {
+        "n": len(samples),
+        "p50_ms": round(float(np.percentile(samples, 50)), 3),
+        "p95_ms": round(float(np.percentile(samples, 95)), 3),
+        "p99_ms": round(float(np.percentile(samples, 99)), 3),
+    }
+
+def run_size(n_rows, backend, queries, batch_users, playlist_size, spotify_latency, seed, neighbour_table=False, workers=None):
+    """Benchmark one catalog size; runs in its own process so peak RSS is per size."""
+    from feature_pipeline import build_embedding
+    from seed_lookup import build_seed_lookup
+    from index_backends import make_index
+    from knn_index import N_NEIGHBORS, INDEX_FORMAT
+    from catalog_store import build_catalog_store
+    from neighbour_table import build_neighbour_table
+    from recommendation import recommend_batch
+    import playlist
+    import top_tracks
+    from fake_spotify import start_fake_spotify, fake_spotify_client
+
+    rng = np.random.default_rng(seed)
+    catalog = synthetic_catalog(n_rows, seed)
+    timings = {}
+
+    # Encoding: embedding matrix, compact catalog store and seed lookup tables
+    elapsed, embedding = _timed(build_embedding, catalog)
+    store_elapsed, store = _timed(build_catalog_store, catalog)
+    seed_elapsed, seed_tables = _timed(build_seed_lookup, catalog)
+    timings["encode"] = _summary([elapsed + store_elapsed + seed_elapsed])
+
+    elapsed, model = _timed(make_index(backend, n_neighbors=N_NEIGHBORS).fit, embedding)
+    timings["index_fit"] = _summary([elapsed])
+    index = {"model": model, "embedding": embedding, "catalog": store, "seed_lookup": seed_tables, "format": INDEX_FORMAT}
+
+    if neighbour_table:
+        elapsed, index["neighbour_table"] = _timed(build_neighbour_table, model, embedding, workers=workers)
+        timings["neighbour_table_build"] = _summary([elapsed])
+
+    samples = []
+    for _ in range(queries):
+        tracks = _seed_tracks(catalog, rng, SEEDS_PER_USER)
+        elapsed, _ = _timed(recommend_batch, {"user": tracks}, index=index)
+        samples.append(elapsed)
+    timings["single_user"] = _summary(samples)
+
+    samples = []
+    for _ in range(max(1, queries // 10)):
+        users = {f"user_{i}": _seed_tracks(catalog, rng, SEEDS_PER_USER) for i in range(batch_users)}
+        elapsed, _ = _timed(recommend_batch, users, index=index)
+        samples.append(elapsed)
+    timings[f"batch_{batch_users}_users"] = _summary(samples)
+
+    # Playlist URI resolution against the local Spotify stand-in, with a cold URI cache
+    server, base_url = start_fake_spotify(latency=spotify_latency)
+    client = fake_spotify_client(base_url)
+    samples = []
+    try:
+        for _ in range(max(1, queries // 10)):
+            playlist._uri_cache.clear()
+            recommendations = store.take(rng.choice(n_rows, size=playlist_size, replace=False))
+            elapsed, _ = _timed(playlist.resolve_track_uris, client, recommendations)
+            samples.append(elapsed)
+        # Three time ranges of two pages each, all fetched at once, with a cold cache
+        fetch_samples = []
+        for _ in range(max(1, queries // 10)):
+            top_tracks._top_tracks_cache.clear()
+            elapsed, _ = _timed(top_tracks.fetch_seed_tracks, client, user_id="fake_user")
+            fetch_samples.append(elapsed)
+    finally:
+        server.shutdown()
+    timings[f"resolve_{playlist_size}_uris"] = _summary(samples)
+    timings["fetch_seed_tracks"] = _summary(fetch_samples)
+
+    # ru_maxrss is reported in kilobytes on Linux
+    peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return {"rows": n_rows, "backend": backend, "peak_rss_mb": round(peak_rss_mb, 1), "timings": timings}
+
+def compare(results, baseline, tolerance):
+    """Return the operations whose p95 regressed by more than `tolerance` against a baseline run."""
+    previous = {(r["rows"], r["backend"]): r["timings"] for r in baseline}
+    regressions = []
+    for result in results:
+        for op, stats in result["timings"].items():
+            old = previous.get((result["rows"], result["backend"]), {}).get(op)
+            if old and stats["p95_ms"] > old["p95_ms"] * (1 + tolerance):
+                regressions.append(f"{result['rows']} rows {op}: p95 {old['p95_ms']}ms -> {stats['p95_ms']}ms")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmark of encoding, index build, queries and playlist URI resolution.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument("--backend", default="brute")
+    parser.add_argument("--queries", type=int, default=100, help="single-user queries per size")
+    parser.add_argument("--batch-users", type=int, default=200)
+    parser.add_argument("--playlist-size", type=int, default=50)
+    parser.add_argument("--spotify-latency", type=float, default=0.02, help="seconds added to each fake API call")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--neighbour-table", action="store_true", help="precompute the top-N table and serve from it")
+    parser.add_argument("--workers", type=int, help="processes for the neighbour table build (default: all cores)")
+    parser.add_argument("--output", help="write results as JSON")
+    parser.add_argument("--baseline", help="JSON from a previous run; exit 1 on p95 regressions")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+
+    results = []
+    for n_rows in args.sizes:
+        # A fresh process per size so peak RSS isn't inherited from larger runs
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as executor:
+            result = executor.submit(
+                run_size, n_rows, args.backend, args.queries, args.batch_users,
+                args.playlist_size, args.spotify_latency, args.seed, args.neighbour_table, args.workers
+            ).result()
+        results.append(result)
+
+        print(f"\n{n_rows:,} rows ({args.backend}), peak RSS {result['peak_rss_mb']} MB")
+        print(pd.DataFrame(result["timings"]).T.to_string())
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            print("\nRegressions:\n" + "\n".join(regressions))
+            sys.exit(1)
+        print("\nNo regressions against baseline.")
+
+if __name__ == "__main__":
+    main()
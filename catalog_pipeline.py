@@ -0,0 +1,239 @@
+import argparse
+import glob
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+import joblib
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from sklearn.preprocessing import StandardScaler
+from feature_pipeline import AUDIO_FEATURES
+from artist_stats import ARTIST_COLUMNS, AUDIO_STAT_FEATURES, ArtistStats, artist_keys, summarize
+
+# The sources merged in the notebook, in priority order: the first occurrence of a track_id wins
+DEFAULT_SOURCES = [
+    "hf://datasets/maharshipandya/spotify-tracks-dataset/dataset.csv",
+    "data/SpotifyAudioFeaturesApril2019.csv",
+    "data/SpotifyAudioFeaturesNov2018.csv",
+    "data/train.csv",
+]
+OUTPUT_DIR = "./catalog_build"
+CHUNK_ROWS = 100_000
+# track_id hash partitions; each is deduplicated and written on its own, so peak memory is
+# roughly one partition rather than the whole catalog
+N_PARTITIONS = 16
+
+COMMON_COLUMNS = [
+    'track_id', 'artist_name', 'track_name', 'album_name',
+    'popularity', 'track_genre', 'duration_ms', 'acousticness',
+    'danceability', 'energy', 'key', 'loudness', 'mode',
+    'speechiness', 'instrumentalness', 'liveness', 'tempo',
+    'time_signature'
+]
+COLUMN_ALIASES = {'artists': 'artist_name'}
+INT_COLUMNS = ['duration_ms', 'key', 'mode', 'time_signature', 'popularity']
+STRING_COLUMNS = ['track_id', 'artist_name', 'track_name', 'album_name', 'track_genre']
+STRING_DEFAULTS = {
+    'artist_name': "unknown_artist",
+    'track_name': "unknown_track",
+    'album_name': "unknown_album",
+    'track_genre': "unknown_genre",
+}
+
+# Spill files keep every numeric column as float64 so missing values survive until the output step
+SPILL_SCHEMA = pa.schema([
+    (col, pa.string() if col in STRING_COLUMNS else pa.float64()) for col in COMMON_COLUMNS
+])
+
+def normalize_chunk(chunk):
+    """Rename, add and type the common columns the way merge_music_datasets did."""
+    chunk = chunk.rename(columns=lambda col: COLUMN_ALIASES.get(col.strip(), col.strip()))
+    chunk = chunk.reindex(columns=COMMON_COLUMNS)
+    for col in COMMON_COLUMNS:
+        if col in STRING_COLUMNS:
+            chunk[col] = chunk[col].astype("string")
+        else:
+            chunk[col] = pd.to_numeric(chunk[col], errors='coerce').astype(np.float64)
+    return chunk[chunk['track_id'].notna()]
+
+def partition_of(track_ids, n_partitions=N_PARTITIONS):
+    """Stable hash partition of each track_id (the same in every process and run)."""
+    hashes = pd.util.hash_pandas_object(track_ids.astype(str), index=False).to_numpy()
+    return (hashes % np.uint64(n_partitions)).astype(np.int64)
+
+def _spill_dir(output_dir, partition):
+    return os.path.join(output_dir, "spill", f"part-{partition:03d}")
+
+def spill_source(source_pos, path, output_dir, n_partitions=N_PARTITIONS, chunk_rows=CHUNK_ROWS):
+    """Stream one CSV in chunks into per-partition spill files; returns the number of rows read.
+
+    Files are named after the source position, so reading a partition's files in name order
+    restores the notebook's concatenation order.
+    """
+    writers = {}
+    n_rows = 0
+    try:
+        for chunk in pd.read_csv(path, chunksize=chunk_rows, low_memory=False):
+            chunk = normalize_chunk(chunk)
+            n_rows += len(chunk)
+            for partition, part in chunk.groupby(partition_of(chunk['track_id'], n_partitions), sort=False):
+                if partition not in writers:
+                    os.makedirs(_spill_dir(output_dir, partition), exist_ok=True)
+                    spill_path = os.path.join(_spill_dir(output_dir, partition), f"source-{source_pos:03d}.parquet")
+                    writers[partition] = pq.ParquetWriter(spill_path, SPILL_SCHEMA)
+                writers[partition].write_table(pa.Table.from_pandas(part, schema=SPILL_SCHEMA, preserve_index=False))
+    finally:
+        for writer in writers.values():
+            writer.close()
+    print(f"Read {n_rows} rows from {path}")
+    return n_rows
+
+def _read_partition(output_dir, partition):
+    files = sorted(glob.glob(os.path.join(_spill_dir(output_dir, partition), "*.parquet")))
+    if not files:
+        return pd.DataFrame({col: pd.Series(dtype="string" if col in STRING_COLUMNS else np.float64) for col in COMMON_COLUMNS})
+    return pd.concat([pq.read_table(path).to_pandas() for path in files], ignore_index=True)
+
+def dedupe_partition(output_dir, partition):
+    """Keep the first row of each track_id in one partition and collect its running statistics.
+
+    Returns per-artist sums (see artist_stats.py) and per-feature sums for the scaler, both of
+    which combine across partitions by addition.
+    """
+    df = _read_partition(output_dir, partition).drop_duplicates(subset='track_id', keep='first')
+    deduped_path = os.path.join(_spill_dir(output_dir, partition), "deduped.parquet")
+    os.makedirs(os.path.dirname(deduped_path), exist_ok=True)
+    pq.write_table(pa.Table.from_pandas(df, schema=SPILL_SCHEMA, preserve_index=False), deduped_path)
+
+    # Artist aggregates use raw popularity and audio values, as create_features did before scaling
+    artist_stats = summarize(df['artist_name'], df['popularity'], df[AUDIO_STAT_FEATURES])
+
+    audio = df[AUDIO_FEATURES]
+    scaler_stats = pd.DataFrame({
+        'count': audio.notna().sum(),
+        'sum': audio.sum(),
+        'sumsq': (audio ** 2).sum(),
+    })
+    return len(df), artist_stats, scaler_stats
+
+def scaler_from_stats(scaler_stats):
+    """A fitted StandardScaler equivalent to fitting on every deduplicated row at once."""
+    stats = scaler_stats.loc[AUDIO_FEATURES]
+    count = stats['count'].to_numpy(dtype=np.float64)
+    mean = stats['sum'].to_numpy() / count
+    var = np.maximum(stats['sumsq'].to_numpy() / count - mean ** 2, 0)
+    scaler = StandardScaler()
+    scaler.feature_names_in_ = np.array(AUDIO_FEATURES, dtype=object)
+    scaler.n_features_in_ = len(AUDIO_FEATURES)
+    scaler.n_samples_seen_ = np.int64(count[0]) if (count == count[0]).all() else count.astype(np.int64)
+    scaler.mean_ = mean
+    scaler.var_ = var
+    scaler.scale_ = np.where(var > 0, np.sqrt(var), 1.0)
+    return scaler
+
+def write_partition(output_dir, partition, features, scaler):
+    """Finish one partition like create_features and write it as an output shard."""
+    deduped_path = os.path.join(_spill_dir(output_dir, partition), "deduped.parquet")
+    df = pq.read_table(deduped_path).to_pandas()
+    df = df.join(features, on=artist_keys(df['artist_name']).to_numpy())
+    for col in ARTIST_COLUMNS:
+        df[col] = df[col].fillna(0)
+    df['artist_track_count'] = df['artist_track_count'].astype(np.int64)
+
+    df[AUDIO_FEATURES] = (df[AUDIO_FEATURES].to_numpy() - scaler.mean_) / scaler.scale_
+    df['duration_minutes'] = df['duration_ms'] / 60000
+    df['popularity'] = df['popularity'] / 100.0
+    for col in INT_COLUMNS:
+        if col != 'popularity':
+            df[col] = df[col].round().astype("Int64")
+    for col, default in STRING_DEFAULTS.items():
+        df[col] = df[col].fillna(default)
+
+    shard_path = os.path.join(output_dir, "catalog", f"shard-{partition:03d}.parquet")
+    os.makedirs(os.path.dirname(shard_path), exist_ok=True)
+    df.to_parquet(shard_path, index=False)
+    return shard_path
+
+def _map(executor, fn, *iterables):
+    return list(executor.map(fn, *iterables)) if executor is not None else list(map(fn, *iterables))
+
+def build_catalog(sources=DEFAULT_SOURCES, output_dir=OUTPUT_DIR, n_partitions=N_PARTITIONS,
+                  chunk_rows=CHUNK_ROWS, scaler_path=None, workers=1):
+    """Merge, deduplicate and featurize the sources into sharded Parquet under output_dir/catalog.
+
+    1. Each source is streamed in chunks into track_id hash partitions (one process per source).
+    2. Each partition is deduplicated, and artist and scaler statistics are summed in that pass.
+    3. Each partition gets its artist features and scaled audio columns and becomes one shard.
+
+    With `scaler_path` the existing scaler is reused; otherwise one is fitted from the statistics
+    and saved next to the shards, as are the artist statistics that seed ingestion (artist_stats.py).
+    Returns the shard paths.
+    """
+    shutil.rmtree(os.path.join(output_dir, "spill"), ignore_errors=True)
+    shutil.rmtree(os.path.join(output_dir, "catalog"), ignore_errors=True)
+    partitions = range(n_partitions)
+
+    executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    try:
+        _map(executor, spill_source, range(len(sources)), sources, [output_dir] * len(sources),
+             [n_partitions] * len(sources), [chunk_rows] * len(sources))
+
+        results = _map(executor, dedupe_partition, [output_dir] * n_partitions, partitions)
+        n_rows = sum(result[0] for result in results)
+        artist_stats = ArtistStats()
+        artist_stats.add_summed(pd.concat([result[1] for result in results]).groupby(level=0).sum())
+        artist_stats.save(os.path.join(output_dir, "artist_stats.npz"))
+        scaler_stats = sum(result[2] for result in results)
+        print(f"{n_rows} unique tracks by {len(artist_stats)} artists")
+
+        if scaler_path:
+            scaler = joblib.load(scaler_path)
+        else:
+            scaler = scaler_from_stats(scaler_stats)
+            joblib.dump(scaler, os.path.join(output_dir, "audio_features_scaler.joblib"))
+
+        artists = artist_stats.to_frame().index
+        features = artist_stats.lookup(artists).set_index(artists)
+        shards = _map(executor, write_partition, [output_dir] * n_partitions, partitions,
+                      [features] * n_partitions, [scaler] * n_partitions)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    shutil.rmtree(os.path.join(output_dir, "spill"), ignore_errors=True)
+    return shards
+
+def insert_shards(shards, name="recommender_spotify", version=2):
+    """Insert the shards into the Hopsworks feature group one at a time."""
+    import hopsworks
+    project = hopsworks.login()
+    recommender = project.get_feature_store().get_or_create_feature_group(
+        name=name,
+        description="Spotify features for recommendation system",
+        version=version,
+        primary_key=["track_id"],
+        event_time=None
+    )
+    for shard in shards:
+        recommender.insert(pd.read_parquet(shard))
+        print(f"Inserted {shard}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the recommender_spotify catalog from the source CSVs in bounded memory.")
+    parser.add_argument("sources", nargs="*", default=DEFAULT_SOURCES, help="CSV paths or URLs, highest priority first")
+    parser.add_argument("--output", default=OUTPUT_DIR)
+    parser.add_argument("--partitions", type=int, default=N_PARTITIONS)
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS)
+    parser.add_argument("--scaler", help="reuse this fitted scaler instead of fitting a new one")
+    parser.add_argument("--workers", type=int, default=1, help="processes for the per-source and per-partition steps")
+    parser.add_argument("--insert", action="store_true", help="insert the shards into the Hopsworks feature group")
+    args = parser.parse_args()
+
+    shards = build_catalog(args.sources, args.output, args.partitions, args.chunk_rows, args.scaler, args.workers)
+    print(f"Wrote {len(shards)} shards to {os.path.join(args.output, 'catalog')}")
+    if args.insert:
+        insert_shards(shards)
+
+if __name__ == "__main__":
+    main()
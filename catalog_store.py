@@ -0,0 +1,78 @@
+import os
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+
+CATALOG_FILE = "catalog.arrow"
+
+# Only what serving needs: identifiers for seeds/playlists and popularity for the fallback
+STRING_COLUMNS = ['track_id', 'track_name', 'artist_name']
+DICTIONARY_COLUMNS = ['track_name', 'artist_name']
+
+class CatalogStore:
+    """Compact, read-only serving catalog backed by a memory-mapped Arrow table.
+
+    Row i is row i of the embedding matrix. Track and artist names are dictionary encoded and
+    popularity is float32; when loaded from disk the buffers are shared by every process that
+    maps the same file.
+    """
+
+    def __init__(self, table):
+        self.table = table
+        self._popular_rows = None
+
+    def __len__(self):
+        return self.table.num_rows
+
+    @property
+    def popularity(self):
+        return self.table.column('popularity').to_numpy()
+
+    def take(self, rows, columns=STRING_COLUMNS):
+        """Materialize the given rows as a small pandas DataFrame with plain string columns."""
+        selected = self.table.select(columns).take(pa.array(np.asarray(rows, dtype=np.int64)))
+        decoded = [
+            pc.cast(selected.column(name), pa.string()) if pa.types.is_dictionary(selected.column(name).type)
+            else selected.column(name)
+            for name in columns
+        ]
+        return pa.table(decoded, names=columns).to_pandas()
+
+    def most_popular(self, n):
+        """Row ids of the n most popular tracks, most popular first."""
+        if self._popular_rows is None or len(self._popular_rows) < n:
+            popularity = self.popularity
+            k = min(max(n, 1000), len(popularity))
+            top = np.argpartition(-popularity, k - 1)[:k] if k < len(popularity) else np.arange(len(popularity))
+            self._popular_rows = top[np.argsort(-popularity[top], kind='stable')].astype(np.int32)
+        return self._popular_rows[:n]
+
+def build_catalog_store(df):
+    """Convert the catalog frame into the compact Arrow layout."""
+    columns = {
+        'row_id': pa.array(np.arange(len(df), dtype=np.int32)),
+        'track_id': pa.array(df['track_id'].astype(str).to_numpy(), type=pa.string()),
+        'popularity': pa.array(df['popularity'].to_numpy(dtype=np.float32, na_value=0.0)),
+    }
+    for name in DICTIONARY_COLUMNS:
+        columns[name] = pa.array(df[name].astype(str).to_numpy(), type=pa.string()).dictionary_encode()
+    return CatalogStore(pa.table(columns))
+
+def save_catalog_store(store, index_dir):
+    """Write the catalog as an uncompressed Arrow IPC file so it can be memory-mapped."""
+    os.makedirs(index_dir, exist_ok=True)
+    path = os.path.join(index_dir, CATALOG_FILE)
+    tmp_path = path + ".tmp"
+    with pa.OSFile(tmp_path, 'wb') as sink:
+        with pa.ipc.new_file(sink, store.table.schema) as writer:
+            writer.write_table(store.table)
+    os.replace(tmp_path, path)
+    return path
+
+def load_catalog_store(index_dir):
+    """Memory-map a saved catalog, or return None if there is none."""
+    path = os.path.join(index_dir, CATALOG_FILE)
+    if not os.path.exists(path):
+        return None
+    source = pa.memory_map(path, 'r')
+    return CatalogStore(pa.ipc.open_file(source).read_all())
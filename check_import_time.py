@@ -0,0 +1,75 @@
+import argparse
+import ast
+import subprocess
+import sys
+
+APP_FILE = "app.py"
+# Import time the app's own module-level imports may add on top of Streamlit itself
+IMPORT_BUDGET_MS = 150
+# Only loaded once a recommendation, upload or playlist is requested
+HEAVY_MODULES = ["hopsworks", "hsfs", "sklearn", "joblib", "pandas", "numpy", "pyarrow", "spotipy", "hnswlib"]
+# The app can't render without these, so their cost is measured separately and not budgeted
+BASELINE_IMPORTS = ["streamlit", "dotenv"]
+_MARKER = "-- app imports --"
+
+def module_level_imports(path=APP_FILE):
+    """Source of the import statements a script runs at module level, in order."""
+    with open(path) as f:
+        source = f.read()
+    tree = ast.parse(source)
+    return [ast.get_source_segment(source, node) for node in tree.body if isinstance(node, (ast.Import, ast.ImportFrom))]
+
+def _parse_importtime(stderr):
+    """(module, self_us, cumulative_us) for every import after the marker in `-X importtime` output."""
+    lines = stderr.splitlines()
+    lines = lines[lines.index(_MARKER) + 1:] if _MARKER in lines else lines
+    imports = []
+    for line in lines:
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        imports.append((name.strip(), int(self_us), int(cumulative_us)))
+    return imports
+
+def measure(statements, baseline=BASELINE_IMPORTS):
+    """Import the baseline, then the given statements, in a fresh interpreter; returns their imports."""
+    code = "\n".join(
+        [f"import {name}" for name in baseline]
+        + [f"import sys; sys.stderr.write({_MARKER!r} + '\\n'); sys.stderr.flush()"]
+        + statements
+    )
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", code], capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing the app's modules failed:\n{result.stderr[-2000:]}")
+    return _parse_importtime(result.stderr)
+
+def main():
+    parser = argparse.ArgumentParser(description="Fail if app.py's module-level imports exceed the import-time budget.")
+    parser.add_argument("--app", default=APP_FILE)
+    parser.add_argument("--budget-ms", type=float, default=IMPORT_BUDGET_MS)
+    parser.add_argument("--runs", type=int, default=3, help="take the fastest of this many fresh interpreters")
+    parser.add_argument("--top", type=int, default=10, help="show this many of the slowest imports")
+    args = parser.parse_args()
+
+    statements = module_level_imports(args.app)
+    runs = [measure(statements) for _ in range(args.runs)]
+    imports = min(runs, key=lambda run: sum(self_us for _, self_us, _ in run))
+    total_ms = sum(self_us for _, self_us, _ in imports) / 1000
+    heavy = sorted({name for name, _, _ in imports if name.split(".")[0] in HEAVY_MODULES})
+
+    print(f"{args.app} module-level imports: {total_ms:.1f} ms (budget {args.budget_ms:.0f} ms), {len(imports)} modules")
+    for name, _, cumulative_us in sorted(imports, key=lambda item: -item[2])[:args.top]:
+        print(f"  {cumulative_us / 1000:8.1f} ms  {name}")
+
+    failures = []
+    if total_ms > args.budget_ms:
+        failures.append(f"import time {total_ms:.1f} ms is over the {args.budget_ms:.0f} ms budget")
+    if heavy:
+        failures.append("heavy modules imported at startup: " + ", ".join(sorted({name.split('.')[0] for name in heavy})))
+    if failures:
+        print("\n".join(["", "FAILED:"] + failures))
+        sys.exit(1)
+    print("OK")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+import os
+import threading
+import time
+from metrics import timed
+
+# How often a cached Hopsworks connection is re-validated before being handed out
+HEALTH_CHECK_INTERVAL = 300
+# How long the Spotify user profile shown in the sidebar is reused
+PROFILE_TTL = 300
+
+# Process-wide Hopsworks handles, shared by every Streamlit session
+_project = None
+_feature_store = None
+_feature_groups = {}
+_last_health_check = 0.0
+_hopsworks_lock = threading.Lock()
+
+def _hopsworks_api_key():
+    # Streamlit is only needed inside the app; the service, shards and benchmark run without it
+    try:
+        import streamlit as st
+        api_key = st.secrets["hopsworks"]["api_key"]
+    except Exception:
+        api_key = os.getenv("HOPSWORKS_API_KEY")
+    if not api_key:
+        raise ValueError("HOPSWORKS_API_KEY not found in secrets. Please check your configuration.")
+    return api_key
+
+def _reset_hopsworks():
+    global _project, _feature_store
+    _project = None
+    _feature_store = None
+    _feature_groups.clear()
+
+def get_feature_store():
+    """Return the process-wide Hopsworks feature store, logging in only when needed."""
+    global _project, _feature_store, _last_health_check
+    with _hopsworks_lock:
+        now = time.monotonic()
+        if _feature_store is not None and now - _last_health_check > HEALTH_CHECK_INTERVAL:
+            # Re-validate the cached connection; a failed call means we log in again
+            try:
+                _project.get_feature_store()
+                _last_health_check = now
+            except Exception as e:
+                print(f"Hopsworks connection check failed, reconnecting: {e}")
+                _reset_hopsworks()
+
+        if _feature_store is None:
+            import hopsworks
+            with timed("hopsworks_login"):
+                _project = hopsworks.login(api_key_value=_hopsworks_api_key())
+            _feature_store = _project.get_feature_store()
+            _last_health_check = now
+        return _feature_store
+
+def get_feature_group(name, version):
+    """Return a cached feature group handle."""
+    fs = get_feature_store()
+    with _hopsworks_lock:
+        key = (name, version)
+        if key not in _feature_groups:
+            _feature_groups[key] = fs.get_feature_group(name=name, version=version)
+        return _feature_groups[key]
+
+def get_spotify_client():
+    """Return this session's Spotify client, creating it (with an in-memory token cache) once."""
+    import streamlit as st
+    from spotipy.cache_handler import MemoryCacheHandler
+    from real_time_data_extraction import init_spotify_client
+    if st.session_state.get("spotify_client") is None:
+        # Tokens are kept per session instead of in a .cache file shared by every user
+        st.session_state.spotify_token_cache = MemoryCacheHandler()
+        st.session_state.spotify_client = init_spotify_client(cache_handler=st.session_state.spotify_token_cache)
+    return st.session_state.spotify_client
+
+def get_user_profile(spotify_client, ttl=PROFILE_TTL):
+    """Return the current user's Spotify profile, memoized in the session for `ttl` seconds."""
+    import streamlit as st
+    cached = st.session_state.get("user_profile")
+    now = time.monotonic()
+    if cached is not None and cached[0] is spotify_client and now - cached[1] < ttl:
+        return cached[2]
+    profile = spotify_client.current_user()
+    st.session_state.user_profile = (spotify_client, now, profile)
+    return profile
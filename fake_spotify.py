@@ -0,0 +1,104 @@
+import hashlib
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+from spotipy import Spotify
+
+# The real API caps top-track pages at 50 items and a total of 100 per time range
+TOP_TRACKS_TOTAL = 100
+
+def _track(track_number, time_range="short_term"):
+    track_id = hashlib.md5(f"{time_range}:{track_number}".encode()).hexdigest()[:22]
+    return {
+        "id": track_id,
+        "uri": f"spotify:track:{track_id}",
+        "name": f"Fake Track {track_number}",
+        "popularity": (track_number * 7) % 100,
+        "artists": [{"name": f"Fake Artist {track_number % 25}"}],
+    }
+
+class FakeSpotifyHandler(BaseHTTPRequestHandler):
+    """Minimal local stand-in for the Spotify Web API endpoints this app calls."""
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, payload, headers=None):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _throttled(self):
+        server = self.server
+        time.sleep(server.latency)
+        with server.lock:
+            server.request_count += 1
+            count = server.request_count
+        if server.rate_limit_every and count % server.rate_limit_every == 0:
+            self._send(429, {"error": {"status": 429, "message": "API rate limit exceeded"}}, {"Retry-After": "0"})
+            return True
+        return False
+
+    def do_GET(self):
+        if self._throttled():
+            return
+        url = urlparse(self.path)
+        params = {key: values[0] for key, values in parse_qs(url.query).items()}
+
+        if url.path == "/v1/search":
+            query = params.get("q", "")
+            track_id = hashlib.md5(query.encode()).hexdigest()[:22]
+            items = [] if "not found" in query.lower() else [{"id": track_id, "uri": f"spotify:track:{track_id}"}]
+            self._send(200, {"tracks": {"items": items[:int(params.get("limit", 1))]}})
+        elif url.path == "/v1/me":
+            self._send(200, {"id": "fake_user", "display_name": "Fake User", "images": [], "followers": {"total": 0}})
+        elif url.path == "/v1/me/top/tracks":
+            limit = min(int(params.get("limit", 20)), 50)
+            offset = int(params.get("offset", 0))
+            time_range = params.get("time_range", "medium_term")
+            items = [_track(i, time_range) for i in range(offset, min(offset + limit, TOP_TRACKS_TOTAL))]
+            self._send(200, {"items": items, "total": TOP_TRACKS_TOTAL, "limit": limit, "offset": offset})
+        else:
+            self._send(404, {"error": {"status": 404, "message": "Not found"}})
+
+    def do_POST(self):
+        if self._throttled():
+            return
+        length = int(self.headers.get("Content-Length", 0))
+        payload = json.loads(self.rfile.read(length) or b"{}")
+        path = urlparse(self.path).path
+
+        if path.startswith("/v1/users/") and path.endswith("/playlists"):
+            playlist_id = hashlib.md5(payload.get("name", "").encode()).hexdigest()[:22]
+            self._send(201, {"id": playlist_id, "external_urls": {"spotify": f"http://fake/{playlist_id}"}})
+        elif path.startswith("/v1/playlists/") and path.endswith("/tracks"):
+            if len(payload.get("uris", [])) > 100:
+                self._send(400, {"error": {"status": 400, "message": "Too many ids requested"}})
+            else:
+                self._send(201, {"snapshot_id": "fake"})
+        else:
+            self._send(404, {"error": {"status": 404, "message": "Not found"}})
+
+def start_fake_spotify(latency=0.0, rate_limit_every=0, port=0):
+    """Start the fake API on a background thread; returns (server, base_url). Call server.shutdown() to stop."""
+    server = ThreadingHTTPServer(("127.0.0.1", port), FakeSpotifyHandler)
+    server.daemon_threads = True
+    server.latency = latency
+    server.rate_limit_every = rate_limit_every
+    server.request_count = 0
+    server.lock = threading.Lock()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/v1/"
+
+def fake_spotify_client(base_url):
+    """A spotipy client that talks to the fake API instead of api.spotify.com."""
+    client = Spotify(auth="fake-token", retries=0, status_retries=0)
+    client.prefix = base_url
+    return client
@@ -0,0 +1,81 @@
+import os
+import joblib
+import numpy as np
+
+SCALER_PATH = "audio_features_scaler.joblib"
+EMBEDDING_FILE = "embedding.npy"
+
+# Same order the scaler was fitted with in create_features
+AUDIO_FEATURES = [
+    'acousticness', 'danceability', 'energy',
+    'instrumentalness', 'liveness', 'tempo',
+    'loudness', 'speechiness'
+]
+
+# Artist averages are stored unscaled, so they go through the scaler of the matching track feature
+ARTIST_FEATURES = {
+    'artist_avg_acousticness': 'acousticness',
+    'artist_avg_danceability': 'danceability',
+    'artist_avg_energy': 'energy',
+}
+
+EMBEDDING_COLUMNS = AUDIO_FEATURES + ['popularity'] + list(ARTIST_FEATURES)
+SOURCE_COLUMNS = EMBEDDING_COLUMNS + ['artist_track_count']
+
+_scalers = {}
+
+def load_scaler(path=SCALER_PATH):
+    """Load the audio feature StandardScaler saved by the notebook's create_features (cached)."""
+    if path not in _scalers:
+        scaler = joblib.load(path)
+        if list(getattr(scaler, 'feature_names_in_', AUDIO_FEATURES)) != AUDIO_FEATURES:
+            raise ValueError(f"Scaler at {path} was not fitted on {AUDIO_FEATURES}")
+        _scalers[path] = scaler
+    return _scalers[path]
+
+def build_embedding(df, scaler=None, audio_scaled=True):
+    """Build a dense, C-contiguous float32 embedding matrix from the catalog's audio columns.
+
+    The feature group stores audio features already standardized by create_features, so they
+    are only passed through the scaler when `audio_scaled` is False (e.g. raw Spotify values).
+    """
+    missing = [col for col in SOURCE_COLUMNS if col not in df.columns]
+    if missing:
+        raise ValueError(f"Catalog is missing embedding columns: {missing}")
+    if scaler is None:
+        scaler = load_scaler()
+    mean = scaler.mean_.astype(np.float32)
+    scale = scaler.scale_.astype(np.float32)
+
+    embedding = np.zeros((len(df), len(EMBEDDING_COLUMNS)), dtype=np.float32)
+
+    audio = df[AUDIO_FEATURES].to_numpy(dtype=np.float32, na_value=0.0)
+    embedding[:, :len(AUDIO_FEATURES)] = audio if audio_scaled else (audio - mean) / scale
+
+    col = len(AUDIO_FEATURES)
+    embedding[:, col] = df['popularity'].to_numpy(dtype=np.float32, na_value=0.0)
+
+    # Rows without artist statistics (artist_track_count == 0) stay at the scaled mean, i.e. 0
+    has_artist_stats = df['artist_track_count'].to_numpy(dtype=np.float32, na_value=0.0) > 0
+    for offset, (artist_col, audio_col) in enumerate(ARTIST_FEATURES.items(), start=col + 1):
+        pos = AUDIO_FEATURES.index(audio_col)
+        values = df[artist_col].to_numpy(dtype=np.float32, na_value=0.0)
+        embedding[:, offset] = np.where(has_artist_stats, (values - mean[pos]) / scale[pos], 0.0)
+
+    return np.ascontiguousarray(embedding)
+
+def save_embedding(embedding, index_dir):
+    """Save the embedding matrix as a .npy file next to the model."""
+    os.makedirs(index_dir, exist_ok=True)
+    path = os.path.join(index_dir, EMBEDDING_FILE)
+    tmp_path = path + ".tmp.npy"
+    np.save(tmp_path, np.ascontiguousarray(embedding, dtype=np.float32))
+    os.replace(tmp_path, path)
+    return path
+
+def load_embedding(index_dir, mmap=True):
+    """Load the embedding matrix, memory-mapped read-only by default."""
+    path = os.path.join(index_dir, EMBEDDING_FILE)
+    if not os.path.exists(path):
+        return None
+    return np.load(path, mmap_mode='r' if mmap else None)
@@ -0,0 +1,216 @@
+import argparse
+import time
+import numpy as np
+import pandas as pd
+from sklearn.cluster import MiniBatchKMeans
+from sklearn.neighbors import NearestNeighbors
+
+# Queries are scored in chunks so the similarity block stays around this many floats
+SIMILARITY_BLOCK_SIZE = 64 * 1024 * 1024
+
+def _normalize(X):
+    """Return float32 unit-length rows; all-zero rows stay zero."""
+    X = np.ascontiguousarray(X, dtype=np.float32)
+    norms = np.linalg.norm(X, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return X / norms
+
+def _top_k(similarities, k):
+    """Indices and similarities of the k largest entries per row, best first."""
+    k = min(k, similarities.shape[1])
+    if k < similarities.shape[1]:
+        part = np.argpartition(-similarities, k - 1, axis=1)[:, :k]
+    else:
+        part = np.broadcast_to(np.arange(similarities.shape[1]), similarities.shape).copy()
+    part_sims = np.take_along_axis(similarities, part, axis=1)
+    # Stable sort on (-similarity) keeps ties in row order
+    order = np.argsort(-part_sims, axis=1, kind="stable")
+    return np.take_along_axis(part, order, axis=1), np.take_along_axis(part_sims, order, axis=1)
+
+class BruteForceIndex:
+    """Exact cosine search using scikit-learn's brute-force NearestNeighbors."""
+
+    def __init__(self, n_neighbors=10):
+        self.n_neighbors = n_neighbors
+        self.model = NearestNeighbors(n_neighbors=n_neighbors, metric='cosine', algorithm='brute')
+
+    def fit(self, X):
+        self.model.fit(np.asarray(X, dtype=np.float32))
+        return self
+
+    def kneighbors(self, X, n_neighbors=None):
+        return self.model.kneighbors(np.asarray(X, dtype=np.float32), n_neighbors=n_neighbors or self.n_neighbors)
+
+class NumpyCosineIndex:
+    """Exact cosine search as a blocked matrix product over pre-normalized float32 rows."""
+
+    def __init__(self, n_neighbors=10):
+        self.n_neighbors = n_neighbors
+        self.vectors = None
+
+    def fit(self, X):
+        self.vectors = _normalize(X)
+        return self
+
+    def kneighbors(self, X, n_neighbors=None):
+        k = n_neighbors or self.n_neighbors
+        queries = _normalize(X)
+        chunk = max(1, SIMILARITY_BLOCK_SIZE // max(1, len(self.vectors)))
+        all_indices, all_distances = [], []
+        for start in range(0, len(queries), chunk):
+            similarities = queries[start:start + chunk] @ self.vectors.T
+            indices, sims = _top_k(similarities, k)
+            all_indices.append(indices)
+            all_distances.append(1.0 - sims)
+        return np.vstack(all_distances), np.vstack(all_indices)
+
+class IVFIndex:
+    """Approximate cosine search over k-means inverted lists; n_probe trades recall for latency."""
+
+    def __init__(self, n_neighbors=10, n_lists=None, n_probe=8, random_state=0):
+        self.n_neighbors = n_neighbors
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.random_state = random_state
+        self.vectors = None
+        self.centroids = None
+        self.list_offsets = None
+        self.list_members = None
+
+    def fit(self, X):
+        self.vectors = _normalize(X)
+        n_lists = self.n_lists or max(1, int(np.sqrt(len(self.vectors))))
+        kmeans = MiniBatchKMeans(n_clusters=n_lists, random_state=self.random_state, n_init=3)
+        assignments = kmeans.fit_predict(self.vectors)
+        self.centroids = _normalize(kmeans.cluster_centers_)
+
+        # CSR-style layout: members of list i are list_members[offsets[i]:offsets[i + 1]]
+        self.list_members = np.argsort(assignments, kind="stable").astype(np.int64)
+        counts = np.bincount(assignments, minlength=n_lists)
+        self.list_offsets = np.concatenate([[0], np.cumsum(counts)])
+        return self
+
+    def kneighbors(self, X, n_neighbors=None):
+        k = n_neighbors or self.n_neighbors
+        queries = _normalize(X)
+        list_order = np.argsort(-(queries @ self.centroids.T), axis=1)
+
+        distances = np.empty((len(queries), k), dtype=np.float32)
+        indices = np.empty((len(queries), k), dtype=np.int64)
+        for i, query in enumerate(queries):
+            # Probe the closest lists, widening until there are at least k candidates
+            candidates = []
+            n_candidates = 0
+            for probed, list_id in enumerate(list_order[i]):
+                if probed >= self.n_probe and n_candidates >= k:
+                    break
+                members = self.list_members[self.list_offsets[list_id]:self.list_offsets[list_id + 1]]
+                candidates.append(members)
+                n_candidates += len(members)
+            candidates = np.sort(np.concatenate(candidates))
+            top, sims = _top_k((self.vectors[candidates] @ query)[None, :], k)
+            indices[i] = candidates[top[0]]
+            distances[i] = 1.0 - sims[0]
+        return distances, indices
+
+class HNSWIndex:
+    """Approximate cosine search on an hnswlib graph; ef trades recall for latency."""
+
+    def __init__(self, n_neighbors=10, M=16, ef_construction=200, ef=64):
+        self.n_neighbors = n_neighbors
+        self.M = M
+        self.ef_construction = ef_construction
+        self.ef = ef
+        self.graph = None
+
+    def fit(self, X):
+        try:
+            import hnswlib
+        except ImportError:
+            raise ImportError("The 'hnsw' index backend requires hnswlib: pip install hnswlib")
+        X = _normalize(X)
+        self.graph = hnswlib.Index(space='cosine', dim=X.shape[1])
+        self.graph.init_index(max_elements=len(X), ef_construction=self.ef_construction, M=self.M)
+        self.graph.add_items(X, np.arange(len(X)))
+        return self
+
+    def kneighbors(self, X, n_neighbors=None):
+        k = n_neighbors or self.n_neighbors
+        self.graph.set_ef(max(self.ef, k))
+        indices, distances = self.graph.knn_query(_normalize(X), k=k)
+        return distances, indices.astype(np.int64)
+
+INDEX_BACKENDS = {
+    "brute": BruteForceIndex,
+    "numpy": NumpyCosineIndex,
+    "ivf": IVFIndex,
+    "hnsw": HNSWIndex,
+}
+
+def make_index(backend="brute", **params):
+    """Create an unfitted nearest-neighbour index by backend name."""
+    if backend not in INDEX_BACKENDS:
+        raise ValueError(f"Unknown index backend '{backend}'. Choose from: {', '.join(INDEX_BACKENDS)}")
+    return INDEX_BACKENDS[backend](**params)
+
+def recall_at_k(approx_indices, exact_indices, k=10):
+    """Mean fraction of the exact top-k neighbours that the approximate search also returned."""
+    hits = [
+        len(np.intersect1d(approx[:k], exact[:k], assume_unique=True)) / k
+        for approx, exact in zip(approx_indices, exact_indices)
+    ]
+    return float(np.mean(hits))
+
+def compare_backends(X, queries, backends, k=10):
+    """Build each backend on X and report build time, query latency and recall@k against exact search."""
+    _, exact = NumpyCosineIndex(n_neighbors=k).fit(X).kneighbors(queries)
+    rows = []
+    for name, params in backends:
+        start = time.perf_counter()
+        try:
+            index = make_index(name, n_neighbors=k, **params).fit(X)
+        except ImportError as e:
+            print(f"Skipping {name}: {e}")
+            continue
+        build_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        _, approx = index.kneighbors(queries)
+        query_seconds = time.perf_counter() - start
+
+        rows.append({
+            "backend": name,
+            "params": params,
+            "build_s": round(build_seconds, 3),
+            "query_ms_per_seed": round(1000 * query_seconds / len(queries), 4),
+            f"recall@{k}": round(recall_at_k(approx, exact, k), 4),
+        })
+    return pd.DataFrame(rows)
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare nearest-neighbour backends on a synthetic catalog.")
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--dim", type=int, default=12)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    X = rng.standard_normal((args.rows, args.dim)).astype(np.float32)
+    queries = X[rng.choice(args.rows, size=args.queries, replace=False)]
+
+    backends = [
+        ("brute", {}),
+        ("numpy", {}),
+        ("ivf", {"n_probe": 1}),
+        ("ivf", {"n_probe": 8}),
+        ("ivf", {"n_probe": 32}),
+        ("hnsw", {"ef": 16}),
+        ("hnsw", {"ef": 64}),
+        ("hnsw", {"ef": 256}),
+    ]
+    print(compare_backends(X, queries, backends, k=args.k).to_string(index=False))
+
+if __name__ == "__main__":
+    main()
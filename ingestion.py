@@ -0,0 +1,229 @@
+import atexit
+import os
+import threading
+import time
+import pandas as pd
+from snapshot_cache import SNAPSHOT_DIR, append_snapshot, read_feature_group
+from artist_stats import AUDIO_STAT_FEATURES, ArtistStats, ArtistStatsStore
+from feature_pipeline import AUDIO_FEATURES, load_scaler
+from connections import get_feature_group
+from metrics import inc, set_gauge, timed
+
+# A micro-batch is flushed when it reaches this many rows or this age in seconds
+FLUSH_ROWS = 500
+FLUSH_INTERVAL = 30
+# Rows kept for retry after failed flushes before the oldest are dropped
+MAX_BUFFERED_ROWS = 50_000
+
+class KnownTrackIds:
+    """Persistent set of track_ids already in the feature group, stored as an append-only text file.
+
+    Ids queued for upload are claimed in memory and only written to the file once their insert
+    succeeded, so rows lost before that (dropped buffer, crash) are uploaded again next time.
+    """
+
+    def __init__(self, feature_group_name, version, known_dir=SNAPSHOT_DIR):
+        self.feature_group_name = feature_group_name
+        self.version = version
+        self.path = os.path.join(known_dir, f"known_track_ids_{feature_group_name}_v{version}.txt")
+        self._ids = None
+        self._pending = set()
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if self._ids is not None:
+            return
+        if os.path.exists(self.path):
+            with open(self.path) as f:
+                self._ids = {line.rstrip("\n") for line in f if line.strip()}
+            return
+        # First run: seed from the catalog snapshot's track_id column
+        feature_group = get_feature_group(self.feature_group_name, self.version)
+        existing = read_feature_group(feature_group, columns=['track_id'])
+        self._ids = set(existing['track_id'].astype(str))
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            f.writelines(f"{track_id}\n" for track_id in self._ids)
+        os.replace(tmp_path, self.path)
+
+    def claim_new(self, track_ids):
+        """Boolean mask of the ids that are neither known nor already queued, claiming them in one step.
+
+        Two sessions uploading the same track can't both pass the check.
+        """
+        with self._lock:
+            self._load()
+            mask = []
+            for track_id in map(str, track_ids):
+                is_new = track_id not in self._ids and track_id not in self._pending
+                if is_new:
+                    self._pending.add(track_id)
+                mask.append(is_new)
+            return mask
+
+    def confirm(self, track_ids):
+        """Record ids whose rows were inserted."""
+        with self._lock:
+            self._load()
+            new_ids = [track_id for track_id in map(str, track_ids) if track_id not in self._ids]
+            self._pending.difference_update(map(str, track_ids))
+            if not new_ids:
+                return
+            self._ids.update(new_ids)
+            with open(self.path, "a") as f:
+                f.writelines(f"{track_id}\n" for track_id in new_ids)
+
+    def release(self, track_ids):
+        """Give up claims on ids whose rows were dropped, so a later upload queues them again."""
+        with self._lock:
+            self._pending.difference_update(map(str, track_ids))
+
+class IngestBuffer:
+    """Buffers rows from many users and inserts them in micro-batches from a background thread.
+
+    Inserted rows are confirmed in `known_ids` and counted in `artist_stats` (if given) only after
+    their insert succeeds, so rows dropped before that are neither known nor counted.
+    """
+
+    def __init__(self, feature_group_name, version, known_ids, artist_stats=None, flush_rows=FLUSH_ROWS,
+                 flush_interval=FLUSH_INTERVAL):
+        self.feature_group_name = feature_group_name
+        self.version = version
+        self.known_ids = known_ids
+        self.artist_stats = artist_stats
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval
+        self._frames = []
+        self._n_rows = 0
+        self._oldest = None
+        self._condition = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name=f"ingest-{feature_group_name}", daemon=True)
+        self._thread.start()
+
+    def submit(self, df):
+        """Queue rows for insertion; returns immediately."""
+        if df.empty:
+            return
+        with self._condition:
+            self._frames.append(df)
+            self._n_rows += len(df)
+            if self._oldest is None:
+                self._oldest = time.monotonic()
+            set_gauge("ingest_buffered_rows", self._n_rows)
+            if self._n_rows >= self.flush_rows:
+                self._condition.notify()
+
+    def _take(self):
+        with self._condition:
+            frames, self._frames = self._frames, []
+            self._n_rows = 0
+            self._oldest = None
+        return frames
+
+    def _requeue(self, batch):
+        with self._condition:
+            if self._n_rows + len(batch) > MAX_BUFFERED_ROWS:
+                print(f"Ingest buffer full, dropping {len(batch)} rows")
+                self.known_ids.release(batch['track_id'])
+                return
+            self._frames.insert(0, batch)
+            self._n_rows += len(batch)
+            if self._oldest is None:
+                self._oldest = time.monotonic()
+
+    def flush(self):
+        """Insert everything buffered so far without waiting for the materialization job."""
+        with self._flush_lock:
+            frames = self._take()
+            if not frames:
+                return 0
+            batch = pd.concat(frames, ignore_index=True).drop_duplicates(subset='track_id')
+            try:
+                feature_group = get_feature_group(self.feature_group_name, self.version)
+                with timed("upload"):
+                    feature_group.insert(batch, write_options={"wait_for_job": False})
+            except Exception as e:
+                print(f"Failed to insert {len(batch)} buffered tracks, will retry: {e}")
+                self._requeue(batch)
+                return 0
+            inc("upload_rows_total", len(batch))
+            self.known_ids.confirm(batch['track_id'])
+            if self.artist_stats is not None:
+                self.artist_stats.add(batch['artist_name'], batch['popularity'] * 100)
+            append_snapshot(batch, self.feature_group_name, self.version)
+            return len(batch)
+
+    def _due(self):
+        return self._oldest is not None and (
+            self._n_rows >= self.flush_rows or time.monotonic() - self._oldest >= self.flush_interval
+        )
+
+    def _run(self):
+        while True:
+            with self._condition:
+                self._condition.wait_for(self._due, timeout=self.flush_interval)
+                due = self._due()
+            if due:
+                self.flush()
+
+_registry_lock = threading.Lock()
+_known_ids = {}
+_buffers = {}
+_artist_stats = {}
+
+def _catalog_artist_stats(feature_group_name, version):
+    """Per-artist statistics of the current catalog, recovered from its stored columns.
+
+    The feature group holds popularity / 100 and standardized audio features, so both are
+    converted back to the raw scale the artist_* columns are computed on. Tracks ingested from
+    Spotify have no audio features (they are stored as 0), so they only count for popularity.
+    """
+    feature_group = get_feature_group(feature_group_name, version)
+    df = read_feature_group(feature_group, columns=['artist_name', 'popularity'] + AUDIO_STAT_FEATURES)
+    scaler = load_scaler()
+    positions = [AUDIO_FEATURES.index(feature) for feature in AUDIO_STAT_FEATURES]
+    audio = df[AUDIO_STAT_FEATURES].where(~(df[AUDIO_STAT_FEATURES] == 0).all(axis=1))
+    audio = audio * scaler.scale_[positions] + scaler.mean_[positions]
+    stats = ArtistStats()
+    stats.add(df['artist_name'], df['popularity'] * 100, audio)
+    return stats
+
+def _known_track_ids(feature_group_name, version):
+    key = (feature_group_name, version)
+    if key not in _known_ids:
+        _known_ids[key] = KnownTrackIds(feature_group_name, version)
+    return _known_ids[key]
+
+def get_known_track_ids(feature_group_name, version):
+    with _registry_lock:
+        return _known_track_ids(feature_group_name, version)
+
+def get_ingest_buffer(feature_group_name, version):
+    with _registry_lock:
+        key = (feature_group_name, version)
+        if key not in _buffers:
+            _buffers[key] = IngestBuffer(feature_group_name, version, _known_track_ids(feature_group_name, version),
+                                         _artist_stats_store(feature_group_name, version))
+        return _buffers[key]
+
+def _artist_stats_store(feature_group_name, version):
+    key = (feature_group_name, version)
+    if key not in _artist_stats:
+        store = ArtistStatsStore(os.path.join(SNAPSHOT_DIR, f"artist_stats_{feature_group_name}_v{version}.npz"))
+        if not store.exists():
+            store.replace(_catalog_artist_stats(feature_group_name, version))
+        _artist_stats[key] = store
+    return _artist_stats[key]
+
+def get_artist_stats(feature_group_name, version):
+    """The persistent artist statistics store, seeded from the catalog on first use."""
+    with _registry_lock:
+        return _artist_stats_store(feature_group_name, version)
+
+@atexit.register
+def flush_all():
+    """Flush every ingest buffer (also runs at interpreter exit)."""
+    for buffer in list(_buffers.values()):
+        buffer.flush()
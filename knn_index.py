@@ -0,0 +1,116 @@
+import hashlib
+import json
+import os
+import joblib
+import pandas as pd
+from index_backends import make_index
+from seed_lookup import build_seed_lookup, load_seed_lookup, save_seed_lookup
+from catalog_store import build_catalog_store, load_catalog_store, save_catalog_store
+from neighbour_table import build_neighbour_table, load_neighbour_table, save_neighbour_table
+from metrics import timed
+from feature_pipeline import (
+    EMBEDDING_COLUMNS,
+    SOURCE_COLUMNS,
+    build_embedding,
+    load_embedding,
+    save_embedding
+)
+
+FEATURE_GROUP_NAME = "recommender_spotify"
+FEATURE_GROUP_VERSION = 2
+
+INDEX_DIR = "./knn_model"
+INDEX_FILE = "knn_index.joblib"
+
+SELECTED_COLUMNS = ['track_id', 'popularity', 'artist_name', 'track_name']
+# Bumped whenever the bundle layout changes so older bundles get rebuilt
+INDEX_FORMAT = 5
+N_NEIGHBORS = 10
+
+# Nearest-neighbour backend: "brute", "numpy", "ivf" or "hnsw" (see index_backends.py)
+INDEX_BACKEND = os.getenv("INDEX_BACKEND", "brute")
+# Backend parameters as JSON, e.g. INDEX_PARAMS='{"n_probe": 16}' for ivf or '{"ef": 128}' for hnsw
+INDEX_PARAMS = json.loads(os.getenv("INDEX_PARAMS") or "{}")
+
+def content_hash(df):
+    """Return a stable hash of the catalog columns the index is built from."""
+    hash_columns = SELECTED_COLUMNS + [col for col in SOURCE_COLUMNS if col not in SELECTED_COLUMNS]
+    row_hashes = pd.util.hash_pandas_object(df[hash_columns], index=False)
+    return hashlib.sha256(row_hashes.values.tobytes()).hexdigest()
+
+def build_index(df, fg_version=FEATURE_GROUP_VERSION, data_hash=None, backend=INDEX_BACKEND, index_params=None):
+    """Fit the KNN model on the audio embedding and bundle it with the compact serving catalog."""
+    if data_hash is None:
+        data_hash = content_hash(df)
+    if index_params is None:
+        index_params = INDEX_PARAMS
+
+    # Row i of the catalog store is row i of the embedding matrix
+    with timed("encode"):
+        embedding = build_embedding(df)
+        catalog = build_catalog_store(df)
+        seed_tables = build_seed_lookup(df)
+
+    knn_model = make_index(backend, n_neighbors=N_NEIGHBORS, **index_params)
+    with timed("fit", backend=backend):
+        knn_model.fit(embedding)
+
+    return {
+        "model": knn_model,
+        "embedding": embedding,
+        "embedding_columns": EMBEDDING_COLUMNS,
+        "catalog": catalog,
+        "seed_lookup": seed_tables,
+        "format": INDEX_FORMAT,
+        "fg_version": fg_version,
+        "content_hash": data_hash,
+        "backend": backend,
+        "index_params": dict(index_params),
+    }
+
+def attach_neighbour_table(index, workers=None):
+    """Precompute every track's top-N neighbours across `workers` processes (see neighbour_table.py)."""
+    with timed("neighbour_table"):
+        index["neighbour_table"] = build_neighbour_table(index["model"], index["embedding"], workers=workers)
+    return index
+
+def save_index(index, index_dir=INDEX_DIR):
+    """Persist an index bundle, replacing any previous one atomically."""
+    os.makedirs(index_dir, exist_ok=True)
+    # The embedding and catalog are stored as .npy / Arrow files so serving can memory-map them
+    save_embedding(index["embedding"], index_dir)
+    save_catalog_store(index["catalog"], index_dir)
+    save_seed_lookup(index["seed_lookup"], index_dir)
+    index_path = os.path.join(index_dir, INDEX_FILE)
+    tmp_path = index_path + ".tmp"
+    if index.get("neighbour_table") is not None:
+        save_neighbour_table(index["neighbour_table"], index_dir)
+    stored_separately = ("embedding", "catalog", "seed_lookup", "neighbour_table")
+    joblib.dump({key: value for key, value in index.items() if key not in stored_separately}, tmp_path)
+    os.replace(tmp_path, index_path)
+    return index_path
+
+def load_index(index_dir=INDEX_DIR):
+    """Load a previously saved index bundle, or return None if there is none."""
+    index_path = os.path.join(index_dir, INDEX_FILE)
+    if not os.path.exists(index_path):
+        return None
+    # mmap_mode lets large arrays inside the model (e.g. fitted vectors) share pages across workers
+    index = joblib.load(index_path, mmap_mode='r')
+    index["embedding"] = load_embedding(index_dir)
+    index["catalog"] = load_catalog_store(index_dir)
+    index["seed_lookup"] = load_seed_lookup(index_dir)
+    index["neighbour_table"] = load_neighbour_table(index_dir)
+    return index
+
+def is_current(index, fg_version=FEATURE_GROUP_VERSION, data_hash=None, backend=INDEX_BACKEND, index_params=None):
+    """Check whether an index bundle matches the feature group version, backend and its parameters (and content hash, if given)."""
+    if index is None or index.get("fg_version") != fg_version or index.get("backend") != backend:
+        return False
+    if index.get("index_params", {}) != (INDEX_PARAMS if index_params is None else index_params):
+        return False
+    if index.get("format") != INDEX_FORMAT or index.get("embedding_columns") != EMBEDDING_COLUMNS:
+        return False
+    if index.get("embedding") is None or index.get("catalog") is None or index.get("seed_lookup") is None:
+        return False
+    return data_hash is None or index.get("content_hash") == data_hash
@@ -0,0 +1,176 @@
+import cProfile
+import os
+import threading
+import time
+from contextlib import ContextDecorator, contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Latency buckets in seconds, from sub-millisecond lookups up to full-catalog reads
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+PROFILE_DIR = "./profiles"
+
+_lock = threading.Lock()
+_counters = {}
+_gauges = {}
+_histograms = {}
+_metrics_server = None
+_metrics_writer = None
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+def inc(name, value=1, **labels):
+    """Increment a counter."""
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+def set_gauge(name, value, **labels):
+    """Set a gauge to the current value."""
+    with _lock:
+        _gauges[_key(name, labels)] = value
+
+def observe(name, value, **labels):
+    """Record one observation in a histogram."""
+    key = _key(name, labels)
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = {"buckets": [0] * len(DEFAULT_BUCKETS), "sum": 0.0, "count": 0}
+        for i, bound in enumerate(DEFAULT_BUCKETS):
+            if value <= bound:
+                histogram["buckets"][i] += 1
+        histogram["sum"] += value
+        histogram["count"] += 1
+
+class timed(ContextDecorator):
+    """Time a block or function into the `<name>_seconds` histogram and count failures.
+
+    Usable as `with timed("feature_read"):` or as a `@timed("spotify_search")` decorator.
+    """
+
+    def __init__(self, name, **labels):
+        self.name = name
+        self.labels = labels
+        self._local = threading.local()
+
+    def __enter__(self):
+        # Thread-local so one decorated function can be timed from many threads at once
+        self._local.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        observe(f"{self.name}_seconds", time.perf_counter() - self._local.start, **self.labels)
+        if exc_type is not None:
+            inc(f"{self.name}_errors_total", **self.labels)
+        return False
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"') for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+def export_prometheus():
+    """Render every metric in the Prometheus text exposition format."""
+    with _lock:
+        counters = dict(_counters)
+        gauges = dict(_gauges)
+        histograms = {key: {**value, "buckets": list(value["buckets"])} for key, value in _histograms.items()}
+
+    lines = []
+    for metric_type, metrics in (("counter", counters), ("gauge", gauges)):
+        for name in sorted({name for name, _ in metrics}):
+            lines.append(f"# TYPE {name} {metric_type}")
+            for (metric_name, labels), value in sorted(metrics.items()):
+                if metric_name == name:
+                    lines.append(f"{name}{_format_labels(labels)} {value}")
+
+    for name in sorted({name for name, _ in histograms}):
+        lines.append(f"# TYPE {name} histogram")
+        for (metric_name, labels), histogram in sorted(histograms.items()):
+            if metric_name != name:
+                continue
+            for bound, count in zip(DEFAULT_BUCKETS, histogram["buckets"]):
+                lines.append(f"{name}_bucket{_format_labels(labels, [('le', bound)])} {count}")
+            lines.append(f"{name}_bucket{_format_labels(labels, [('le', '+Inf')])} {histogram['count']}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {histogram['sum']}")
+            lines.append(f"{name}_count{_format_labels(labels)} {histogram['count']}")
+    return "\n".join(lines) + "\n"
+
+def write_metrics(path):
+    """Write the current metrics to a file (e.g. for node_exporter's textfile collector)."""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        f.write(export_prometheus())
+    os.replace(tmp_path, path)
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = export_prometheus().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+def start_metrics_server(port, host="127.0.0.1"):
+    """Serve /metrics on a local port; only the first call per process starts a server."""
+    global _metrics_server
+    with _lock:
+        if _metrics_server is None:
+            _metrics_server = ThreadingHTTPServer((host, port), _MetricsHandler)
+            _metrics_server.daemon_threads = True
+            threading.Thread(target=_metrics_server.serve_forever, daemon=True).start()
+    return _metrics_server
+
+def start_metrics_file_writer(path, interval=15):
+    """Rewrite the metrics file every `interval` seconds from a background thread (once per process)."""
+    global _metrics_writer
+
+    def run():
+        while True:
+            time.sleep(interval)
+            write_metrics(path)
+
+    with _lock:
+        if _metrics_writer is None:
+            _metrics_writer = threading.Thread(target=run, name="metrics-writer", daemon=True)
+            _metrics_writer.start()
+    return _metrics_writer
+
+@contextmanager
+def profiled(name, enabled=False):
+    """Profile a block with pyinstrument if installed, else cProfile, and save the report under PROFILE_DIR."""
+    if not enabled:
+        yield None
+        return
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    stem = os.path.join(PROFILE_DIR, f"{name}-{time.strftime('%Y%m%d-%H%M%S')}")
+    try:
+        from pyinstrument import Profiler
+    except ImportError:
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield stem + ".prof"
+        finally:
+            profiler.disable()
+            profiler.dump_stats(stem + ".prof")
+        return
+
+    profiler = Profiler()
+    profiler.start()
+    try:
+        yield stem + ".html"
+    finally:
+        profiler.stop()
+        with open(stem + ".html", "w") as f:
+            f.write(profiler.output_html())
@@ -0,0 +1,154 @@
+import os
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from multiprocessing import shared_memory
+import numpy as np
+from threadpoolctl import threadpool_limits
+from index_backends import BruteForceIndex, NumpyCosineIndex, _normalize, _top_k
+
+# Neighbours stored per track; serving falls back to the live index for requests needing more
+NEIGHBOUR_TABLE_SIZE = 50
+NEIGHBOUR_IDS_FILE = "neighbour_ids.npy"
+NEIGHBOUR_DISTANCES_FILE = "neighbour_distances.npy"
+CHUNK_ROWS = 2048
+# Candidate rows scored per block in exact builds. Chunk and shard boundaries never depend on the
+# worker count, so every query sees the same blocks and the table is identical however it is split.
+SHARD_ROWS = 8192
+
+# Arrays and model of the current build; in pool workers the arrays are views over shared memory
+_arrays = {}
+_segments = []
+_worker_model = None
+
+def _init_worker(model, handles):
+    global _worker_model
+    _worker_model = model
+    # One BLAS thread per worker: no oversubscription, and the same arithmetic in every process
+    threadpool_limits(limits=1)
+    for name, (segment_name, shape, dtype) in handles.items():
+        segment = shared_memory.SharedMemory(name=segment_name)
+        _segments.append(segment)
+        _arrays[name] = np.ndarray(shape, dtype=dtype, buffer=segment.buf)
+
+@contextmanager
+def _shared_arrays(specs):
+    """Allocate {name: (shape, dtype)} arrays in shared memory; yields the arrays and their handles."""
+    segments, arrays, handles = [], {}, {}
+    try:
+        for name, (shape, dtype) in specs.items():
+            dtype = np.dtype(dtype)
+            segment = shared_memory.SharedMemory(create=True, size=max(1, int(np.prod(shape)) * dtype.itemsize))
+            segments.append(segment)
+            arrays[name] = np.ndarray(shape, dtype=dtype, buffer=segment.buf)
+            handles[name] = (segment.name, shape, dtype.str)
+        yield arrays, handles
+    finally:
+        # Views must be gone before the segments can be closed
+        arrays.clear()
+        for segment in segments:
+            segment.close()
+            segment.unlink()
+
+def _sort_neighbours(ids, distances):
+    """Order each row by distance, breaking ties by row id."""
+    order = np.lexsort((ids, distances), axis=1)
+    return np.take_along_axis(ids, order, axis=1), np.take_along_axis(distances, order, axis=1)
+
+def _drop_self(ids, distances, rows, n_neighbours):
+    """Remove each row from its own neighbour list, keeping n_neighbours columns."""
+    keep = ids != rows[:, None]
+    # Rows whose own id wasn't returned (e.g. exact duplicates crowding it out) drop their last column
+    keep[keep.all(axis=1), -1] = False
+    return ids[keep].reshape(len(rows), n_neighbours), distances[keep].reshape(len(rows), n_neighbours)
+
+def _normalize_chunk(start, stop, n_neighbours):
+    _arrays["vectors"][start:stop] = _normalize(_arrays["embedding"][start:stop])
+
+def _exact_chunk(start, stop, n_neighbours):
+    """Exact top-N for rows [start, stop): top-N within each shard of the catalog, merged as we go."""
+    vectors = _arrays["vectors"]
+    rows = np.arange(start, stop)
+    best_ids = np.empty((len(rows), 0), dtype=np.int64)
+    best_distances = np.empty((len(rows), 0), dtype=np.float32)
+    for shard_start in range(0, len(vectors), SHARD_ROWS):
+        similarities = vectors[start:stop] @ vectors[shard_start:shard_start + SHARD_ROWS].T
+        own = (rows >= shard_start) & (rows < shard_start + similarities.shape[1])
+        similarities[own.nonzero()[0], rows[own] - shard_start] = -np.inf
+        shard_ids, shard_similarities = _top_k(similarities, n_neighbours)
+        ids = np.hstack([best_ids, shard_ids + shard_start])
+        distances = np.hstack([best_distances, 1 - shard_similarities])
+        best_ids, best_distances = (part[:, :n_neighbours] for part in _sort_neighbours(ids, distances))
+    _arrays["ids"][start:stop] = best_ids
+    _arrays["distances"][start:stop] = best_distances
+
+def _model_chunk(start, stop, n_neighbours):
+    """Top-N for rows [start, stop) from the fitted (approximate) index."""
+    distances, ids = _worker_model.kneighbors(np.asarray(_arrays["embedding"][start:stop]), n_neighbors=n_neighbours + 1)
+    ids, distances = _drop_self(np.asarray(ids), np.asarray(distances), np.arange(start, stop), n_neighbours)
+    _arrays["ids"][start:stop], _arrays["distances"][start:stop] = _sort_neighbours(ids, distances)
+
+def build_neighbour_table(model, embedding, n_neighbours=NEIGHBOUR_TABLE_SIZE, workers=None, chunk_rows=CHUNK_ROWS):
+    """Materialize every track's top-N neighbours (int32 ids, float16 cosine distances).
+
+    The embedding is placed in shared memory once and fixed-size chunks of rows are processed by
+    `workers` processes (default: all cores), each writing its rows of the table in place. Exact
+    backends are scored shard by shard without the fitted model; approximate ones query it.
+    The result does not depend on the number of workers.
+    """
+    n_rows = len(embedding)
+    n_neighbours = min(n_neighbours, n_rows - 1)
+    chunks = [(start, min(start + chunk_rows, n_rows)) for start in range(0, n_rows, chunk_rows)]
+    exact = isinstance(model, (BruteForceIndex, NumpyCosineIndex))
+    steps = [_normalize_chunk, _exact_chunk] if exact else [_model_chunk]
+    specs = {
+        "embedding": (embedding.shape, np.float32),
+        "ids": ((n_rows, n_neighbours), np.int32),
+        "distances": ((n_rows, n_neighbours), np.float16),
+    }
+    if exact:
+        specs["vectors"] = (embedding.shape, np.float32)
+
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(chunks) == 1:
+        global _worker_model
+        _worker_model = model
+        _arrays.update({name: np.empty(shape, dtype=dtype) for name, (shape, dtype) in specs.items()})
+        _arrays["embedding"][:] = embedding
+        try:
+            with threadpool_limits(limits=1):
+                for step in steps:
+                    for start, stop in chunks:
+                        step(start, stop, n_neighbours)
+            return _arrays["ids"], _arrays["distances"]
+        finally:
+            _arrays.clear()
+            _worker_model = None
+
+    starts, stops = zip(*chunks)
+    with _shared_arrays(specs) as (arrays, handles):
+        arrays["embedding"][:] = embedding
+        # Exact builds don't need the model in the workers, only the shared arrays
+        initargs = (None if exact else model, handles)
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=initargs) as executor:
+            for step in steps:
+                # Each step writes its rows in place; draining the map waits for it and re-raises worker errors
+                list(executor.map(step, starts, stops, repeat(n_neighbours)))
+        table = arrays["ids"].copy(), arrays["distances"].copy()
+    return table
+
+def save_neighbour_table(table, index_dir):
+    """Save the neighbour table as two .npy files next to the model."""
+    os.makedirs(index_dir, exist_ok=True)
+    for array, name in zip(table, (NEIGHBOUR_IDS_FILE, NEIGHBOUR_DISTANCES_FILE)):
+        path = os.path.join(index_dir, name)
+        tmp_path = path + ".tmp.npy"
+        np.save(tmp_path, array)
+        os.replace(tmp_path, path)
+
+def load_neighbour_table(index_dir):
+    """Memory-map a saved neighbour table, or return None if there is none."""
+    paths = [os.path.join(index_dir, name) for name in (NEIGHBOUR_IDS_FILE, NEIGHBOUR_DISTANCES_FILE)]
+    if not all(os.path.exists(path) for path in paths):
+        return None
+    return tuple(np.load(path, mmap_mode='r') for path in paths)
@@ -0,0 +1,55 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from metrics import observe
+
+# Shared by all sessions; background stages (e.g. the Hopsworks upload) run here
+_background = ThreadPoolExecutor(max_workers=4, thread_name_prefix="pipeline")
+
+class PipelineEvent:
+    """Progress event emitted when a stage starts, finishes or fails."""
+
+    def __init__(self, stage, status, elapsed=None, message=None):
+        self.stage = stage
+        self.status = status
+        self.elapsed = elapsed
+        self.message = message
+
+class Pipeline:
+    """Runs named stages in order, timing each one and reporting progress events.
+
+    `on_event` is only called on the thread that created the pipeline (the Streamlit script
+    thread); background stages report their outcome through the Future run_background returns.
+    """
+
+    def __init__(self, on_event=None):
+        self.on_event = on_event
+        self.timings = {}
+        self._owner = threading.get_ident()
+
+    def _emit(self, stage, status, elapsed=None, message=None):
+        if self.on_event is not None and threading.get_ident() == self._owner:
+            self.on_event(PipelineEvent(stage, status, elapsed, message))
+
+    def _timed(self, stage, fn, *args, **kwargs):
+        self._emit(stage, "started")
+        start = time.perf_counter()
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            self.timings[stage] = time.perf_counter() - start
+            observe("pipeline_stage_seconds", self.timings[stage], stage=stage, outcome="failed")
+            self._emit(stage, "failed", self.timings[stage], str(e))
+            raise
+        self.timings[stage] = time.perf_counter() - start
+        observe("pipeline_stage_seconds", self.timings[stage], stage=stage, outcome="finished")
+        self._emit(stage, "finished", self.timings[stage])
+        return result
+
+    def run_stage(self, stage, fn, *args, **kwargs):
+        """Run a stage on the calling thread and return its result."""
+        return self._timed(stage, fn, *args, **kwargs)
+
+    def run_background(self, stage, fn, *args, **kwargs):
+        """Start a stage off the critical path and return its Future."""
+        return _background.submit(self._timed, stage, fn, *args, **kwargs)
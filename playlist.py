@@ -0,0 +1,59 @@
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from spotipy.exceptions import SpotifyException
+from ttl_cache import TTLCache
+from metrics import inc, timed
+
+SEARCH_WORKERS = 8
+MAX_RETRIES = 5
+BACKOFF_SECONDS = 0.5
+# Spotify's limit for a single "add items to playlist" call
+PLAYLIST_ADD_LIMIT = 100
+
+# (track_name, artist_name) -> URI (or None if Spotify had no match), shared by all sessions
+_uri_cache = TTLCache(maxsize=50_000, ttl=24 * 3600)
+_NOT_CACHED = object()
+
+def _with_backoff(call, *args, **kwargs):
+    """Call the Spotify API, backing off and retrying when rate limited (HTTP 429)."""
+    for attempt in range(MAX_RETRIES):
+        try:
+            return call(*args, **kwargs)
+        except SpotifyException as e:
+            if e.http_status != 429 or attempt == MAX_RETRIES - 1:
+                raise
+            inc("spotify_rate_limited_total")
+            retry_after = (e.headers or {}).get("Retry-After")
+            delay = float(retry_after) if retry_after else BACKOFF_SECONDS * 2 ** attempt
+            time.sleep(delay + random.uniform(0, BACKOFF_SECONDS))
+
+def search_track_uri(spotify_client, track_name, artist_name):
+    """Look up the Spotify URI of a track, using the shared URI cache."""
+    key = (track_name, artist_name)
+    uri = _uri_cache.get(key, _NOT_CACHED)
+    if uri is not _NOT_CACHED:
+        inc("spotify_uri_cache_hits_total")
+        return uri
+    inc("spotify_uri_cache_misses_total")
+
+    query = f"track:{track_name} artist:{artist_name}"
+    with timed("spotify_search"):
+        search_results = _with_backoff(spotify_client.search, q=query, type="track", limit=1)
+    items = search_results["tracks"]["items"]
+    uri = items[0]["uri"] if items else None
+    _uri_cache.set(key, uri)
+    return uri
+
+def resolve_track_uris(spotify_client, recommendations, max_workers=SEARCH_WORKERS):
+    """Resolve recommendation rows to Spotify URIs concurrently, keeping their order."""
+    pairs = list(zip(recommendations["track_name"], recommendations["artist_name"]))
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        uris = list(executor.map(lambda pair: search_track_uri(spotify_client, *pair), pairs))
+    return [uri for uri in uris if uri is not None]
+
+def add_tracks_to_playlist(spotify_client, playlist_id, track_uris):
+    """Add tracks to a playlist in chunks of Spotify's per-request limit."""
+    for start in range(0, len(track_uris), PLAYLIST_ADD_LIMIT):
+        with timed("spotify_playlist_add"):
+            _with_backoff(spotify_client.playlist_add_items, playlist_id, track_uris[start:start + PLAYLIST_ADD_LIMIT])
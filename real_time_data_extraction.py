@@ -1,22 +1,26 @@
 from spotipy import Spotify
 from spotipy.oauth2 import SpotifyOAuth
 from dotenv import load_dotenv
-import hopsworks
 import pandas as pd
-import os
 import streamlit as st
 import numpy as np
+from ingestion import get_artist_stats, get_known_track_ids, get_ingest_buffer
+from artist_stats import ARTIST_COLUMNS, summarize
+from metrics import timed
 # load_dotenv()
 
-def init_spotify_client():
+def init_spotify_client(cache_handler=None):
     """Initialize the Spotify client using SpotifyOAuth directly."""
-    return Spotify(auth_manager=SpotifyOAuth(
+    # 429s are left to playlist._with_backoff, which honours Retry-After; spotipy retrying them too multiplies the attempts
+    return Spotify(status_forcelist=(500, 502, 503, 504), auth_manager=SpotifyOAuth(
         client_id=st.secrets["spotify"]["SPOTIPY_CLIENT_ID"], #os.getenv("SPOTIPY_CLIENT_ID"),
         client_secret=st.secrets["spotify"]["SPOTIPY_CLIENT_SECRET"], #os.getenv("SPOTIPY_CLIENT_SECRET"),
         redirect_uri=st.secrets["spotify"]["SPOTIPY_REDIRECT_URI"], #os.getenv("SPOTIPY_REDIRECT_URI"),
-        scope="user-top-read playlist-modify-public playlist-modify-private"
+        scope="user-top-read playlist-modify-public playlist-modify-private",
+        cache_handler=cache_handler
     ))
 
+@timed("spotify_fetch")
 def fetch_top_tracks(spotify_client, limit=10, time_range="short_term"):
     """Fetch user's top tracks."""
     results = spotify_client.current_user_top_tracks(limit=limit, time_range=time_range)
@@ -61,50 +65,44 @@ def process_spotify_data(tracks):
     return pd.DataFrame(data)
 
 def upload_to_hopsworks(df, feature_group_name="recommender_spotify", version=2):
-    """Upload DataFrame to Hopsworks Feature Group, skipping tracks that already exist."""
-    import numpy as np
-    
-    # Get API key from secrets
-    hopsworks_api_key = st.secrets["hopsworks"]["api_key"]
-    if not hopsworks_api_key:
-        raise ValueError("HOPSWORKS_API_KEY not found in secrets. Please check your configuration.")
-    
-    # Set environment variable for Hopsworks
-    os.environ["HOPSWORKS_API_KEY"] = hopsworks_api_key
-    
-    # Connect to Hopsworks
-    project = hopsworks.login()
-    fs = project.get_feature_store()
-    feature_group = fs.get_feature_group(name=feature_group_name, version=version)
-    
-    # Fetch existing tracks to check for duplicates
-    existing_df = feature_group.read()
-    existing_track_ids = set(existing_df['track_id'].tolist())
-    
-    # Filter to only include new tracks
-    new_tracks_df = df[~df['track_id'].isin(existing_track_ids)]
+    """Queue a DataFrame for upload to the Hopsworks Feature Group, skipping tracks that already exist."""
+    # Claim the tracks that are neither in the feature group nor already queued by another session
+    known_track_ids = get_known_track_ids(feature_group_name, version)
+    new_tracks_df = df[known_track_ids.claim_new(df['track_id'])].copy()
     
     # If no new tracks, skip upload
     if new_tracks_df.empty:
         return "No new tracks to upload. Using existing data."
     
-    # Prepare new tracks for upload
-    columns_to_convert = [
-        "acousticness", "danceability", "energy", "loudness", "speechiness", 
-        "instrumentalness", "liveness", "tempo", "time_signature", 
-        "artist_avg_popularity", "artist_popularity_std", "artist_track_count", 
-        "artist_avg_acousticness", "artist_avg_danceability", "artist_avg_energy", 
-        "duration_minutes"
-    ]
-    
-    # Convert to appropriate types
-    new_tracks_df[columns_to_convert] = new_tracks_df[columns_to_convert].astype(float)    
-    new_tracks_df["time_signature"] = new_tracks_df["time_signature"].astype(np.int64)
+    try:
+        # Artist features from the running per-artist statistics, counting the new tracks too as a
+        # full recompute would; the statistics themselves only take them once their insert succeeds
+        artist_stats = get_artist_stats(feature_group_name, version)
+        pending = summarize(new_tracks_df['artist_name'], new_tracks_df['popularity'] * 100)
+        new_tracks_df[ARTIST_COLUMNS] = artist_stats.lookup(new_tracks_df['artist_name'], pending).to_numpy()
+
+        # Prepare new tracks for upload
+        columns_to_convert = [
+            "acousticness", "danceability", "energy", "loudness", "speechiness", 
+            "instrumentalness", "liveness", "tempo", "time_signature", 
+            "artist_avg_popularity", "artist_popularity_std", "artist_track_count", 
+            "artist_avg_acousticness", "artist_avg_danceability", "artist_avg_energy", 
+            "duration_minutes"
+        ]
     
-    # Upload only the new tracks
-    feature_group.insert(new_tracks_df, write_options={"wait_for_job": True})
+        # Convert to appropriate types
+        new_tracks_df[columns_to_convert] = new_tracks_df[columns_to_convert].astype(float)    
+        new_tracks_df["time_signature"] = new_tracks_df["time_signature"].astype(np.int64)
     
-    return f"Uploaded {len(new_tracks_df)} new tracks to Hopsworks"
+        # Buffer only the new tracks; they are inserted in micro-batches in the background and
+        # become known once their insert succeeds
+        get_ingest_buffer(feature_group_name, version).submit(new_tracks_df)
+    except Exception:
+        # Nothing was queued, so the tracks must stay uploadable
+        known_track_ids.release(new_tracks_df['track_id'])
+        raise
+
+    return f"Queued {len(new_tracks_df)} new tracks for upload to Hopsworks"
 
 if __name__ == "__main__":
     # Initialize Spotify client using SpotifyOAuth directly
@@ -1,66 +1,257 @@
-import hopsworks
-import os
-from sklearn.preprocessing import LabelEncoder
-import joblib
-import streamlit as st
-import hopsworks
 import os
+import threading
+import time
+import numpy as np
 import pandas as pd
-from sklearn.preprocessing import LabelEncoder
-from sklearn.neighbors import NearestNeighbors
+from knn_index import (
+    FEATURE_GROUP_NAME,
+    FEATURE_GROUP_VERSION,
+    build_index,
+    is_current
+)
+from artifacts import current_version, load_current_index, load_version, publish_index
+from snapshot_cache import read_feature_group
+from seed_lookup import resolve_seeds
+from recommendation_cache import get_result_cache, seed_fingerprint
+from connections import get_feature_group
+from metrics import inc, set_gauge, timed
+
+# Seconds between checks for a newly published index version
+ARTIFACT_POLL_INTERVAL = float(os.getenv("ARTIFACT_POLL_INTERVAL", "30"))
+
+# Prebuilt index shared by every session in this process
+_index = None
+_index_lock = threading.Lock()
+_watcher = None
+# Published versions that failed to load, so they aren't retried on every poll
+_rejected_versions = set()
+
+def _read_catalog(fg_version):
+    """Read the full catalog through the local snapshot of the Hopsworks feature group."""
+    spotify_features = get_feature_group(FEATURE_GROUP_NAME, fg_version)
+    return read_feature_group(spotify_features)
+
+def _serve(index):
+    """Make an index the one new requests use; requests already running keep the one they started with."""
+    global _index
+    _index = index
+    if index.get("version"):
+        set_gauge("index_version", int(index["version"][1:]))
+
+def get_index(fg_version=FEATURE_GROUP_VERSION):
+    """Return the process-wide KNN index, loading the current published version on first use.
+
+    An index is only built here when nothing usable has been published yet.
+    """
+    index = _index
+    if is_current(index, fg_version):
+        return index
+
+    with _index_lock:
+        if is_current(_index, fg_version):
+            return _index
+
+        index = load_current_index()
+        if not is_current(index, fg_version):
+            print("No prebuilt index for this feature group version. Building one.")
+            index = build_index(_read_catalog(fg_version), fg_version)
+            publish_index(index)
+        _serve(index)
+        _start_watcher(fg_version)
+        return _index
+
+def swap_to_current(fg_version=FEATURE_GROUP_VERSION):
+    """Load the published version CURRENT points at and swap it in if it isn't the one being served.
+
+    Returns True if the served index changed.
+    """
+    version = current_version()
+    if version is None or version in _rejected_versions or (_index or {}).get("version") == version:
+        return False
+    index = load_version(version)
+    if not is_current(index, fg_version):
+        _rejected_versions.add(version)
+        return False
+    with _index_lock:
+        _serve(index)
+    inc("index_swaps_total")
+    print(f"Now serving index version {version}.")
+    return True
+
+def _start_watcher(fg_version, interval=ARTIFACT_POLL_INTERVAL):
+    """Poll for new published versions from a daemon thread (once per process)."""
+    global _watcher
+
+    def run():
+        while True:
+            time.sleep(interval)
+            try:
+                swap_to_current(fg_version)
+            except Exception as e:
+                print(f"Failed to check for a new index version: {e}")
+
+    if _watcher is None and interval > 0:
+        _watcher = threading.Thread(target=run, name="index-watcher", daemon=True)
+        _watcher.start()
+
+def _popular_tracks(catalog, n_recommendations):
+    """Popularity-based fallback for users with no tracks in the catalog."""
+    return catalog.take(catalog.most_popular(n_recommendations))
+
+def _merge_candidates(seed_user, seed_rows, cand_user, cand_row, cand_dist, n_rows, n_recommendations):
+    """Merge per-seed neighbour lists into each user's top n, excluding the user's own seeds.
 
-def get_recommendations(top_tracks):
-    """Get song recommendations by training a KNN model on the fly."""
+    A track reached from several seeds is ranked by its closest occurrence.
+    """
+    # Drop each user's own seed tracks
+    cand_key = cand_user * n_rows + cand_row
+    keep = ~np.isin(cand_key, seed_user * n_rows + seed_rows)
+    cand_user, cand_row, cand_dist, cand_key = cand_user[keep], cand_row[keep], cand_dist[keep], cand_key[keep]
+
+    # Order by user then distance, and keep each (user, track) pair's closest occurrence
+    order = np.lexsort((cand_dist, cand_user))
+    cand_user, cand_row, cand_dist, cand_key = cand_user[order], cand_row[order], cand_dist[order], cand_key[order]
+    _, first = np.unique(cand_key, return_index=True)
+    first.sort()
+    cand_user, cand_row, cand_dist = cand_user[first], cand_row[first], cand_dist[first]
+
+    # Rank within each user and cut at n_recommendations
+    group_start = np.searchsorted(cand_user, cand_user, side='left')
+    rank = np.arange(len(cand_user)) - group_start
+    keep = rank < n_recommendations
+    return cand_user[keep], cand_row[keep], cand_dist[keep], rank[keep]
+
+@timed("recommend")
+def recommend_batch(users, n_recommendations=10, index=None):
+    """Recommend tracks for many users from the neighbour table, with one kneighbors call for the rest.
+
+    `users` maps a user id to that user's list of Spotify track dicts. A track's `seed_weight`
+    (default 1) scales how much its neighbours count: each candidate's distance is divided by the
+    weight of the seed it came from. Returns one row per recommendation with columns user_id,
+    rank, track_id, track_name, artist_name and distance (that weighted distance).
+    Uses the process-wide index unless an index bundle is passed in.
+    """
+    if index is None:
+        index = get_index()
+    knn_model = index["model"]
+    catalog = index["catalog"]
+    n_rows = len(catalog)
+    user_ids = list(users)
+
+    # Resolve seeds through the precomputed track_id / name tables; users whose seed set was
+    # answered recently for this index version are served from the result cache
+    version = index.get("version")
+    cache = get_result_cache() if version else None
+    seed_user, seed_rows, seed_weight, cache_keys, matched_users = [], [], [], {}, set()
+    out_user, out_row, out_dist, out_rank = [], [], [], []
+    for user_pos, user_id in enumerate(user_ids):
+        rows, weights = resolve_seeds(index["seed_lookup"], users[user_id])
+        if not len(rows):
+            continue
+        matched_users.add(user_pos)
+        if cache is not None:
+            key = seed_fingerprint(rows, n_recommendations, version, weights)
+            cached = cache.get(key, version)
+            if cached is not None:
+                out_user.append(np.full(len(cached[0]), user_pos))
+                out_row.append(cached[0])
+                out_dist.append(cached[1])
+                out_rank.append(np.arange(len(cached[0])))
+                continue
+            cache_keys[user_pos] = key
+        seed_rows.append(rows)
+        seed_weight.append(weights)
+        seed_user.append(np.full(len(rows), user_pos))
+    seed_rows = np.concatenate(seed_rows) if seed_rows else np.empty(0, dtype=np.int64)
+    seed_weight = np.concatenate(seed_weight) if seed_weight else np.empty(0, dtype=np.float64)
+    seed_user = np.concatenate(seed_user) if seed_user else np.empty(0, dtype=np.int64)
+
+    frames = []
+    if len(seed_rows):
+        # Ask for enough neighbours that excluding a user's own seeds still leaves n per user
+        max_seeds = np.bincount(seed_user).max()
+        k = min(n_rows - 1, n_recommendations + max_seeds)
+
+        # Seeds in the precomputed table are plain lookups of up to k of their stored neighbours
+        table = index.get("neighbour_table")
+        in_table = seed_rows < len(table[0]) if table is not None else np.zeros(len(seed_rows), dtype=bool)
+        table_k = min(k, table[0].shape[1]) if table is not None else 0
+        if in_table.any():
+            table_ids = np.asarray(table[0][seed_rows[in_table], :table_k], dtype=np.int64)
+            if table_k < k:
+                # A shorter row is still exact if n of its tracks remain once the user's own seeds
+                # are excluded: anything past the row is farther than those n
+                is_seed = np.isin(seed_user[in_table, None] * n_rows + table_ids, seed_user * n_rows + seed_rows)
+                enough = (~is_seed).sum(axis=1) >= n_recommendations
+                in_table[in_table] = enough
+                table_ids = table_ids[enough]
+        inc("neighbour_table_seeds_total", int(in_table.sum()), source="table")
+        inc("neighbour_table_seeds_total", int((~in_table).sum()), source="kneighbors")
+
+        cand_user, cand_row, cand_dist = [], [], []
+        if in_table.any():
+            cand_user.append(np.repeat(seed_user[in_table], table_k))
+            cand_row.append(table_ids.ravel())
+            distances = np.asarray(table[1][seed_rows[in_table], :table_k], dtype=np.float32)
+            cand_dist.append((distances / seed_weight[in_table, None]).astype(np.float32).ravel())
+        if not in_table.all():
+            # On-the-fly fallback for tracks missing from the table
+            queries = index["embedding"][seed_rows[~in_table]]
+            with timed("kneighbors"):
+                distances, indices = knn_model.kneighbors(queries, n_neighbors=k)
+            cand_user.append(np.repeat(seed_user[~in_table], k))
+            cand_row.append(indices.ravel().astype(np.int64))
+            cand_dist.append((distances / seed_weight[~in_table, None]).ravel().astype(np.float32))
+
+        cand_user, cand_row, cand_dist, rank = _merge_candidates(
+            seed_user, seed_rows, np.concatenate(cand_user), np.concatenate(cand_row), np.concatenate(cand_dist),
+            n_rows, n_recommendations
+        )
+
+        if cache_keys:
+            # Candidates are grouped by user, so each user's results are one contiguous slice
+            computed, starts = np.unique(cand_user, return_index=True)
+            for user_pos, start, stop in zip(computed, starts, list(starts[1:]) + [len(cand_user)]):
+                cache.set(cache_keys[int(user_pos)], version, cand_row[start:stop], cand_dist[start:stop])
+        out_user.append(cand_user)
+        out_row.append(cand_row)
+        out_dist.append(cand_dist)
+        out_rank.append(rank)
+
+    if out_user:
+        # Cached and freshly computed users back in request order
+        out_user, out_row, out_dist, out_rank = map(np.concatenate, (out_user, out_row, out_dist, out_rank))
+        order = np.lexsort((out_rank, out_user))
+        recs = catalog.take(out_row[order])
+        recs.insert(0, 'rank', out_rank[order] + 1)
+        recs.insert(0, 'user_id', [user_ids[pos] for pos in out_user[order]])
+        recs['distance'] = out_dist[order]
+        frames.append(recs)
+
+    # Popularity-based recommendations for users with no matching tracks
+    unmatched = [user_id for pos, user_id in enumerate(user_ids) if pos not in matched_users]
+    inc("recommend_users_total", len(user_ids))
+    if unmatched:
+        inc("recommend_fallback_users_total", len(unmatched))
+        print(f"No matching tracks found for {len(unmatched)} user(s). Using popularity-based recommendations.")
+        popular = _popular_tracks(catalog, n_recommendations)
+        for user_id in unmatched:
+            recs = popular.reset_index(drop=True)
+            recs.insert(0, 'rank', np.arange(1, len(recs) + 1))
+            recs.insert(0, 'user_id', user_id)
+            recs['distance'] = np.nan
+            frames.append(recs)
+
+    if not frames:
+        return pd.DataFrame(columns=['user_id', 'rank', 'track_id', 'track_name', 'artist_name', 'distance'])
+    return pd.concat(frames, ignore_index=True)
+
+def get_recommendations(top_tracks, n_recommendations=10):
+    """Get song recommendations for one user from the prebuilt KNN index."""
     try:
-        # Connect to Hopsworks
-        os.environ["HOPSWORKS_API_KEY"] = st.secrets["hopsworks"]["api_key"]
-        project = hopsworks.login()
-        
-        # Get feature data
-        fs = project.get_feature_store()
-        spotify_features = fs.get_feature_group(name="recommender_spotify", version=2)
-        df = spotify_features.read()
-        
-        # Prepare data
-        selected_columns = ['popularity', 'artist_name', 'track_name']
-        training_data = df[selected_columns].copy()
-        
-        # Encode features
-        label_encoder_artist = LabelEncoder()
-        label_encoder_track = LabelEncoder()
-        training_data['artist_encoded'] = label_encoder_artist.fit_transform(training_data['artist_name'])
-        training_data['track_encoded'] = label_encoder_track.fit_transform(training_data['track_name'])
-        
-        # Train KNN model directly
-        features = training_data[['popularity', 'artist_encoded', 'track_encoded']]
-        knn_model = NearestNeighbors(n_neighbors=10, metric='cosine')
-        knn_model.fit(features)
-        
-        # Process user tracks
-        training_data['track_name'] = training_data['track_name'].str.strip().str.lower()
-        user_tracks = [track["name"].strip().lower() for track in top_tracks]
-        filtered_tracks = training_data[training_data['track_name'].isin(user_tracks)]
-        
-        if filtered_tracks.empty:
-            print("No matching tracks found. Using popularity-based recommendations.")
-            return training_data.sort_values(by='popularity', ascending=False).head(10)[['track_name', 'artist_name']]
-        
-        # Generate recommendations
-        user_features = filtered_tracks[['popularity', 'artist_encoded', 'track_encoded']]
-        distances, indices = knn_model.kneighbors(user_features, n_neighbors=10)
-        
-        # Collect unique recommendations
-        all_indices = indices.flatten()
-        unique_indices = []
-        for idx in all_indices:
-            if idx not in unique_indices:
-                unique_indices.append(idx)
-                if len(unique_indices) >= 10:
-                    break
-        
-        recommendations = training_data.iloc[unique_indices]
+        recommendations = recommend_batch({"user": top_tracks}, n_recommendations)
         return recommendations[['track_name', 'artist_name']]
-        
+
     except Exception as e:
         import traceback
         traceback.print_exc()
@@ -0,0 +1,137 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import numpy as np
+from ttl_cache import TTLCache
+from metrics import inc
+
+RESULT_CACHE_TTL = float(os.getenv("RECOMMENDATION_CACHE_TTL", "3600"))
+RESULT_CACHE_MAX_BYTES = int(os.getenv("RECOMMENDATION_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+# Set to a file path to share cached results between processes (e.g. several app workers)
+RESULT_CACHE_DB = os.getenv("RECOMMENDATION_CACHE_DB")
+# The shared database is trimmed to its byte bound every this many writes
+SQLITE_TRIM_EVERY = 100
+
+def seed_fingerprint(seed_rows, n_recommendations, version, seed_weights=None):
+    """Stable key for one user's request: the resolved seed rows and their weights, the list length and the index version."""
+    rows, first = np.unique(np.asarray(seed_rows, dtype=np.int64), return_index=True)
+    digest = hashlib.sha256(f"{version}:{n_recommendations}:".encode())
+    digest.update(rows.tobytes())
+    if seed_weights is not None:
+        digest.update(np.asarray(seed_weights, dtype=np.float64)[first].tobytes())
+    return digest.hexdigest()
+
+def _result_bytes(result):
+    rows, distances = result
+    return rows.nbytes + distances.nbytes
+
+class SQLiteResultStore:
+    """Cached results in a SQLite file, shared by every process that opens it."""
+
+    def __init__(self, path, ttl=RESULT_CACHE_TTL, maxbytes=RESULT_CACHE_MAX_BYTES):
+        self.ttl = ttl
+        self.maxbytes = maxbytes
+        self._writes = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=5, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, version TEXT, expires_at REAL, "
+            "last_used REAL, rows BLOB, distances BLOB)"
+        )
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT rows, distances FROM results WHERE key = ? AND expires_at >= ?", (key, now)
+            ).fetchone()
+            if row is None:
+                return None
+            self._conn.execute("UPDATE results SET last_used = ? WHERE key = ?", (now, key))
+        return np.frombuffer(row[0], dtype=np.int32), np.frombuffer(row[1], dtype=np.float32)
+
+    def set(self, key, version, result):
+        rows, distances = result
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?)",
+                (key, version, now + self.ttl, now, rows.tobytes(), distances.tobytes()),
+            )
+            self._writes += 1
+            if self._writes % SQLITE_TRIM_EVERY == 0:
+                self._trim(now)
+
+    def _trim(self, now):
+        """Drop expired entries, then least recently used ones until the byte bound holds."""
+        self._conn.execute("DELETE FROM results WHERE expires_at < ?", (now,))
+        # Keep the most recently used entries whose running size still fits; everything older goes
+        self._conn.execute(
+            "DELETE FROM results WHERE key IN (SELECT key FROM (SELECT key, SUM(LENGTH(rows) + LENGTH(distances)) "
+            "OVER (ORDER BY last_used DESC, key DESC) AS kept_bytes FROM results) WHERE kept_bytes > ?)",
+            (self.maxbytes,),
+        )
+
+    def drop_other_versions(self, version):
+        with self._lock:
+            self._conn.execute("DELETE FROM results WHERE version != ?", (version,))
+
+class RecommendationCache:
+    """Per-user recommendation results (row ids and distances) keyed by seed fingerprint.
+
+    Lookups go to an in-process LRU first and then, if configured, to the shared SQLite store.
+    Everything cached for an index version is dropped when a different version is seen.
+    """
+
+    def __init__(self, ttl=RESULT_CACHE_TTL, maxbytes=RESULT_CACHE_MAX_BYTES, db_path=RESULT_CACHE_DB):
+        self.memory = TTLCache(maxsize=1_000_000, ttl=ttl, maxbytes=maxbytes, sizeof=_result_bytes)
+        self.shared = SQLiteResultStore(db_path, ttl, maxbytes) if db_path else None
+        self.version = None
+        self._lock = threading.Lock()
+
+    def _check_version(self, version):
+        if version == self.version:
+            return
+        with self._lock:
+            if version != self.version:
+                self.memory.clear()
+                if self.shared is not None:
+                    self.shared.drop_other_versions(version)
+                self.version = version
+
+    def get(self, key, version):
+        self._check_version(version)
+        result = self.memory.get(key)
+        if result is not None:
+            inc("recommendation_cache_hits_total", backend="memory")
+            return result
+        if self.shared is not None:
+            result = self.shared.get(key)
+            if result is not None:
+                inc("recommendation_cache_hits_total", backend="sqlite")
+                self.memory.set(key, result)
+                return result
+        inc("recommendation_cache_misses_total")
+        return None
+
+    def set(self, key, version, rows, distances):
+        self._check_version(version)
+        result = (np.asarray(rows, dtype=np.int32), np.asarray(distances, dtype=np.float32))
+        self.memory.set(key, result)
+        if self.shared is not None:
+            self.shared.set(key, version, result)
+
+_result_cache = None
+_result_cache_lock = threading.Lock()
+
+def get_result_cache():
+    """The process-wide recommendation cache."""
+    global _result_cache
+    if _result_cache is None:
+        with _result_cache_lock:
+            if _result_cache is None:
+                _result_cache = RecommendationCache()
+    return _result_cache
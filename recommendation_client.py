@@ -0,0 +1,44 @@
+import json
+import os
+import time
+import urllib.error
+import urllib.request
+import pandas as pd
+from metrics import inc, timed
+
+RECOMMENDER_URL = os.getenv("RECOMMENDER_URL", "http://127.0.0.1:8502")
+CLIENT_TIMEOUT = 15.0
+# Retries when the service answers 503 (its queue is full)
+OVERLOAD_RETRIES = 2
+
+def _seed_fields(track):
+    """Only what the service needs to resolve and weight a seed, not the whole Spotify track object."""
+    fields = {
+        "id": track.get("id"),
+        "name": track.get("name"),
+        "artists": [{"name": artist.get("name")} for artist in track.get("artists", [])],
+    }
+    if "seed_weight" in track:
+        fields["seed_weight"] = track["seed_weight"]
+    return fields
+
+def get_recommendations(top_tracks, n_recommendations=10, url=None, timeout=CLIENT_TIMEOUT):
+    """Get song recommendations for one user from the recommendation service."""
+    url = (url or RECOMMENDER_URL).rstrip("/") + "/recommend"
+    body = json.dumps({"tracks": [_seed_fields(track) for track in top_tracks], "n": n_recommendations}).encode()
+    for attempt in range(OVERLOAD_RETRIES + 1):
+        request = urllib.request.Request(url, data=body, headers={"Content-Type": "application/json"})
+        try:
+            with timed("recommend_remote"):
+                with urllib.request.urlopen(request, timeout=timeout) as response:
+                    payload = json.load(response)
+            return pd.DataFrame(payload["recommendations"], columns=['track_name', 'artist_name'])
+        except urllib.error.HTTPError as e:
+            if e.code == 503 and attempt < OVERLOAD_RETRIES:
+                inc("recommend_remote_retries_total")
+                time.sleep(float(e.headers.get("Retry-After") or 1))
+                continue
+            detail = e.read().decode(errors="replace")
+            raise Exception(f"Error getting recommendations: service returned {e.code}: {detail}")
+        except (urllib.error.URLError, TimeoutError) as e:
+            raise Exception(f"Error getting recommendations: {e}")
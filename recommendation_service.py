@@ -0,0 +1,249 @@
+import argparse
+import atexit
+import json
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from metrics import export_prometheus, inc, set_gauge, timed
+
+DEFAULT_PORT = 8502
+# A batch is sent as soon as it has this many users or its first request has waited this long
+MAX_BATCH_USERS = 256
+MAX_WAIT_MS = 5
+# Requests waiting for a batch beyond this are rejected with 503 instead of queueing up latency
+MAX_QUEUE = 1024
+REQUEST_TIMEOUT = 10.0
+MAX_RECOMMENDATIONS = 100
+MAX_BODY_BYTES = 1024 * 1024
+
+class ServiceOverloaded(Exception):
+    pass
+
+class _Request:
+    __slots__ = ("tracks", "n_recommendations", "deadline", "future")
+
+    def __init__(self, tracks, n_recommendations, deadline):
+        self.tracks = tracks
+        self.n_recommendations = n_recommendations
+        self.deadline = deadline
+        self.future = Future()
+
+class MicroBatcher:
+    """Coalesces concurrent single-user requests into one recommend_batch call.
+
+    Requests go into a bounded queue; a worker thread takes the first waiting request, gathers
+    whatever else arrives within `max_wait_ms` (up to `max_batch_users`), and answers all of
+    them from one vectorized neighbour lookup.
+    """
+
+    def __init__(self, recommend_batch, max_batch_users=MAX_BATCH_USERS, max_wait_ms=MAX_WAIT_MS, max_queue=MAX_QUEUE):
+        self.recommend_batch = recommend_batch
+        self.max_batch_users = max_batch_users
+        self.max_wait = max_wait_ms / 1000
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = threading.Thread(target=self._run, name="recommend-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, tracks, n_recommendations, timeout=REQUEST_TIMEOUT):
+        """Queue one user's request; returns a Future of that user's recommendations DataFrame."""
+        request = _Request(tracks, n_recommendations, time.monotonic() + timeout)
+        try:
+            self._queue.put_nowait(request)
+        except queue.Full:
+            inc("service_rejected_total")
+            raise ServiceOverloaded(f"More than {self._queue.maxsize} requests waiting")
+        set_gauge("service_queue_depth", self._queue.qsize())
+        return request.future
+
+    def recommend(self, tracks, n_recommendations, timeout=REQUEST_TIMEOUT):
+        """Blocking form of submit(); raises TimeoutError if the deadline passes."""
+        return self.submit(tracks, n_recommendations, timeout).result(timeout=timeout)
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        flush_at = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_users:
+            remaining = flush_at - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            set_gauge("service_queue_depth", self._queue.qsize())
+            now = time.monotonic()
+            live = []
+            for request in batch:
+                # Callers that already gave up are not worth a neighbour lookup
+                if request.deadline < now or not request.future.set_running_or_notify_cancel():
+                    inc("service_expired_total")
+                    continue
+                live.append(request)
+            if not live:
+                continue
+
+            inc("service_batches_total")
+            inc("service_batched_users_total", len(live))
+            n_recommendations = max(request.n_recommendations for request in live)
+            try:
+                with timed("service_batch"):
+                    recs = self.recommend_batch({pos: request.tracks for pos, request in enumerate(live)}, n_recommendations)
+            except Exception as e:
+                for request in live:
+                    request.future.set_exception(e)
+                continue
+
+            by_user = dict(iter(recs.groupby('user_id', sort=False)))
+            for pos, request in enumerate(live):
+                user_recs = by_user.get(pos, recs.iloc[0:0])
+                request.future.set_result(user_recs[user_recs['rank'] <= request.n_recommendations])
+
+def _parse_request(body):
+    """Validate a /recommend body; returns (tracks, n_recommendations) or raises ValueError."""
+    payload = json.loads(body)
+    tracks = payload.get("tracks")
+    if not isinstance(tracks, list) or not all(isinstance(track, dict) for track in tracks):
+        raise ValueError("'tracks' must be a list of Spotify track objects")
+    for track in tracks:
+        weight = track.get("seed_weight", 1.0)
+        if isinstance(weight, bool) or not isinstance(weight, (int, float)) or not 0 < weight < float("inf"):
+            raise ValueError("'seed_weight' must be a positive number")
+    n_recommendations = payload.get("n", 10)
+    if not isinstance(n_recommendations, int) or not 1 <= n_recommendations <= MAX_RECOMMENDATIONS:
+        raise ValueError(f"'n' must be an integer between 1 and {MAX_RECOMMENDATIONS}")
+    return tracks, n_recommendations
+
+class RecommendationHandler(BaseHTTPRequestHandler):
+    """POST /recommend, GET /healthz and GET /metrics; `server.batcher` does the work."""
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, payload, headers=()):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        path = self.path.split("?")[0]
+        if path == "/healthz":
+            self._send_json(200, self.server.status())
+        elif path == "/metrics":
+            body = export_prometheus().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        else:
+            self._send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        if self.path.split("?")[0] != "/recommend":
+            self._send_json(404, {"error": "not found"})
+            return
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > MAX_BODY_BYTES:
+            self._send_json(413, {"error": "request body too large"})
+            return
+        try:
+            tracks, n_recommendations = _parse_request(self.rfile.read(length))
+        except (ValueError, AttributeError) as e:
+            inc("service_requests_total", status="400")
+            self._send_json(400, {"error": str(e)})
+            return
+
+        try:
+            recs = self.server.batcher.recommend(tracks, n_recommendations, timeout=self.server.request_timeout)
+        except ServiceOverloaded as e:
+            inc("service_requests_total", status="503")
+            self._send_json(503, {"error": str(e)}, headers=[("Retry-After", "1")])
+            return
+        except TimeoutError:
+            inc("service_requests_total", status="504")
+            self._send_json(504, {"error": f"No result within {self.server.request_timeout}s"})
+            return
+        except Exception as e:
+            inc("service_requests_total", status="500")
+            self._send_json(500, {"error": str(e)})
+            return
+
+        inc("service_requests_total", status="200")
+        columns = ['rank', 'track_id', 'track_name', 'artist_name', 'distance']
+        rows = recs[columns].astype(object).where(recs[columns].notna(), None).to_dict(orient="records")
+        self._send_json(200, {"version": self.server.version(), "recommendations": rows})
+
+def _index_status(get_index):
+    index = get_index()
+    return {"status": "ok", "version": index.get("version"), "rows": len(index["catalog"])}
+
+def make_server(host="127.0.0.1", port=DEFAULT_PORT, max_batch_users=MAX_BATCH_USERS, max_wait_ms=MAX_WAIT_MS,
+                max_queue=MAX_QUEUE, request_timeout=REQUEST_TIMEOUT, recommend=None, get_index=None, coordinator=None):
+    """Create the HTTP server; the index is loaded (once) before it accepts requests.
+
+    With a shard_coordinator.ShardCoordinator, requests are answered by its shards instead.
+    """
+    server = ThreadingHTTPServer((host, port), RecommendationHandler)
+    server.daemon_threads = True
+    if coordinator is not None:
+        recommend = coordinator.recommend_batch
+        server.status = coordinator.status
+        server.version = lambda: coordinator.version
+    else:
+        if recommend is None or get_index is None:
+            from recommendation import get_index as default_get_index, recommend_batch
+            recommend = recommend or recommend_batch
+            get_index = get_index or default_get_index
+        get_index()
+        server.status = lambda: _index_status(get_index)
+        server.version = lambda: get_index().get("version")
+    server.batcher = MicroBatcher(recommend, max_batch_users, max_wait_ms, max_queue)
+    server.request_timeout = request_timeout
+    return server
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve recommendations over HTTP, batching concurrent requests.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--max-batch-users", type=int, default=MAX_BATCH_USERS)
+    parser.add_argument("--max-wait-ms", type=float, default=MAX_WAIT_MS)
+    parser.add_argument("--max-queue", type=int, default=MAX_QUEUE)
+    parser.add_argument("--timeout", type=float, default=REQUEST_TIMEOUT, help="seconds before a request gets 504")
+    parser.add_argument("--shards", help="serve from running shard_server.py processes, as host:port,host:port,...")
+    parser.add_argument("--local-shards", type=int, help="start this many shard_server.py processes on this machine")
+    parser.add_argument("--catalog", nargs="+",
+                        help="catalog Parquet files or globs for --local-shards (default: the feature group snapshot)")
+    parser.add_argument("--shard-timeout", type=float, help="seconds a shard has to answer before it is left out")
+    args = parser.parse_args()
+
+    coordinator = None
+    if args.shards or args.local_shards:
+        from shard_coordinator import SHARD_TIMEOUT, connect, launch_local_shards, parse_addresses
+        authkey = None
+        if args.local_shards:
+            processes, addresses, authkey = launch_local_shards(args.local_shards, args.catalog)
+            atexit.register(lambda: [process.terminate() for process in processes])
+        else:
+            addresses = parse_addresses(args.shards)
+        coordinator = connect(addresses, authkey, args.shard_timeout or SHARD_TIMEOUT)
+        print(f"Connected to {len(addresses)} shards")
+
+    server = make_server(args.host, args.port, args.max_batch_users, args.max_wait_ms, args.max_queue, args.timeout,
+                         coordinator=coordinator)
+    print(f"Serving recommendations on http://{args.host}:{args.port}/recommend")
+    server.serve_forever()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+import os
+import re
+from hashlib import blake2b
+import numpy as np
+
+_WHITESPACE = re.compile(r"\s+")
+# Catalog rows join artists with ';' and Spotify rows with ', '; the key uses the first one
+_ARTIST_SEPARATOR = re.compile(r"\s*[;,]\s*")
+# Each table is one flat array saved next to the catalog, so every worker maps the same pages
+SEED_LOOKUP_FILES = {
+    "id_hashes": "seed_id_hashes.npy",
+    "id_rows": "seed_id_rows.npy",
+    "name_hashes": "seed_name_hashes.npy",
+    "name_offsets": "seed_name_offsets.npy",
+    "name_rows": "seed_name_rows.npy",
+}
+
+def normalize_name(name):
+    """Lowercase, strip and collapse whitespace in a track or artist name."""
+    return _WHITESPACE.sub(" ", str(name)).strip().lower()
+
+def primary_artist(artist_name):
+    """Normalized first artist of a joined artist string."""
+    return normalize_name(_ARTIST_SEPARATOR.split(str(artist_name).strip(), maxsplit=1)[0])
+
+def _normalize_series(names):
+    """Vectorized normalize_name over a column."""
+    return names.astype(str).str.replace(_WHITESPACE, " ", regex=True).str.strip().str.lower()
+
+def _hash(keys):
+    """64-bit hashes of strings; the same for a key at build time and at lookup time (and across processes)."""
+    return np.fromiter(
+        (int.from_bytes(blake2b(key.encode(), digest_size=8).digest(), "little") for key in keys),
+        dtype=np.uint64, count=len(keys)
+    )
+
+def _name_keys(track_names, artists):
+    return [f"{track_name}\0{artist}" for track_name, artist in zip(track_names, artists)]
+
+def build_seed_lookup(lookup):
+    """Precompute track_id -> row and (track name, primary artist) -> rows tables for seed resolution.
+
+    Keys are stored as sorted 64-bit hashes and found with a binary search, so the tables are
+    plain arrays that can be memory-mapped instead of Python dicts rebuilt in every worker.
+    """
+    track_names = _normalize_series(lookup['track_name'])
+    artists = _normalize_series(
+        lookup['artist_name'].astype(str).str.strip().str.split(_ARTIST_SEPARATOR, n=1, regex=True).str[0]
+    )
+
+    # First occurrence wins if a track_id appears more than once
+    id_hashes = _hash(lookup['track_id'].astype(str).to_numpy())
+    order = np.argsort(id_hashes, kind="stable")
+    unique_hashes, first = np.unique(id_hashes[order], return_index=True)
+    id_rows = order[first].astype(np.int32)
+
+    # CSR layout: rows of name key g are name_rows[name_offsets[g]:name_offsets[g + 1]]
+    name_hashes = _hash(_name_keys(track_names.to_numpy(), artists.to_numpy()))
+    name_rows = np.argsort(name_hashes, kind="stable").astype(np.int32)
+    unique_names, starts = np.unique(name_hashes[name_rows], return_index=True)
+    name_offsets = np.append(starts, len(name_rows)).astype(np.int64)
+
+    return {
+        "id_hashes": unique_hashes,
+        "id_rows": id_rows,
+        "name_hashes": unique_names,
+        "name_offsets": name_offsets,
+        "name_rows": name_rows,
+    }
+
+def save_seed_lookup(seed_lookup, index_dir):
+    os.makedirs(index_dir, exist_ok=True)
+    for key, name in SEED_LOOKUP_FILES.items():
+        np.save(os.path.join(index_dir, name), seed_lookup[key])
+
+def load_seed_lookup(index_dir, mmap=True):
+    """Memory-map saved seed tables, or return None if there are none."""
+    paths = {key: os.path.join(index_dir, name) for key, name in SEED_LOOKUP_FILES.items()}
+    if not all(os.path.exists(path) for path in paths.values()):
+        return None
+    return {key: np.load(path, mmap_mode='r' if mmap else None) for key, path in paths.items()}
+
+def _find(sorted_hashes, hashes):
+    """Position of each hash in sorted_hashes, or -1 if absent."""
+    if not len(sorted_hashes):
+        return np.full(len(hashes), -1, dtype=np.int64)
+    positions = np.searchsorted(sorted_hashes, hashes)
+    clipped = np.minimum(positions, len(sorted_hashes) - 1)
+    return np.where((positions < len(sorted_hashes)) & (sorted_hashes[clipped] == hashes), positions, -1)
+
+def lookup_track_ids(seed_lookup, track_ids):
+    """Catalog row of each track_id, or -1 for ids not in the catalog."""
+    if not len(track_ids):
+        return np.empty(0, dtype=np.int64)
+    positions = _find(seed_lookup["id_hashes"], _hash([str(track_id) for track_id in track_ids]))
+    return np.where(positions >= 0, np.asarray(seed_lookup["id_rows"])[np.maximum(positions, 0)], -1).astype(np.int64)
+
+def _track_name_key(track):
+    artists = track.get("artists") or []
+    artist_name = artists[0]["name"] if artists else track.get("artist_name", "")
+    return normalize_name(track.get("name", "")), primary_artist(artist_name)
+
+def resolve_seeds(seed_lookup, tracks, by_name=True):
+    """Map Spotify track dicts to catalog rows: by track_id first, then by (name, primary artist).
+
+    With `by_name=False` only track_ids are matched. Returns the unique rows and each row's seed weight: the track's `seed_weight` (1 if it has
+    none), or the highest one if several tracks resolve to the same row.
+    """
+    if not tracks:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+    weights = np.array([track.get("seed_weight", 1.0) for track in tracks], dtype=np.float64)
+    by_id = lookup_track_ids(seed_lookup, [track.get("id") for track in tracks])
+    rows, row_weights = [by_id[by_id >= 0]], [weights[by_id >= 0]]
+
+    unmatched = np.flatnonzero(by_id < 0) if by_name else []
+    if len(unmatched):
+        keys = [_track_name_key(tracks[pos]) for pos in unmatched]
+        groups = _find(seed_lookup["name_hashes"], _hash(_name_keys([key[0] for key in keys], [key[1] for key in keys])))
+        offsets = seed_lookup["name_offsets"]
+        for pos, group in zip(unmatched, groups):
+            if group >= 0:
+                rows.append(np.asarray(seed_lookup["name_rows"][offsets[group]:offsets[group + 1]]))
+                row_weights.append(np.full(len(rows[-1]), weights[pos]))
+
+    rows, row_weights = np.concatenate(rows).astype(np.int64), np.concatenate(row_weights)
+    # Heaviest first within each row, so the first occurrence of a row carries its highest weight
+    order = np.lexsort((-row_weights, rows))
+    rows, first = np.unique(rows[order], return_index=True)
+    return rows, row_weights[order][first]
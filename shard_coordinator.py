@@ -0,0 +1,236 @@
+import heapq
+import os
+import secrets
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from itertools import islice
+from multiprocessing.connection import Client
+import numpy as np
+import pandas as pd
+from shard_server import DEFAULT_PORT, shard_authkey
+from metrics import inc, timed
+
+# Seconds a shard has to answer one scatter before the query goes ahead without it
+SHARD_TIMEOUT = 2.0
+
+class ShardsUnavailable(Exception):
+    pass
+
+class ShardClient:
+    """One persistent connection to a shard server, used by one request at a time."""
+
+    def __init__(self, address, authkey):
+        self.address = address
+        self.authkey = authkey
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def call(self, message, timeout):
+        """Send one request and wait up to `timeout` seconds for its answer.
+
+        On a timeout the connection is dropped, since its late answer would otherwise be read
+        as the answer to the next request; the next call reconnects.
+        """
+        deadline = time.monotonic() + timeout
+        if not self._lock.acquire(timeout=timeout):
+            raise TimeoutError(f"Shard {self.address} is busy")
+        try:
+            if self._conn is None:
+                self._conn = Client(self.address, authkey=self.authkey)
+            self._conn.send(message)
+            if not self._conn.poll(max(0.0, deadline - time.monotonic())):
+                self._close()
+                raise TimeoutError(f"Shard {self.address} did not answer within {timeout}s")
+            status, result = self._conn.recv()
+        except (OSError, EOFError):
+            self._close()
+            raise
+        finally:
+            self._lock.release()
+        if status != "ok":
+            raise RuntimeError(f"Shard {self.address}: {result}")
+        return result
+
+    def close(self):
+        with self._lock:
+            self._close()
+
+class ShardCoordinator:
+    """Scatter-gather recommendations over track_id hash shards (see shard_server.py).
+
+    A query is answered in two rounds: every shard resolves the seeds it owns to embedding
+    vectors and seed weights (by track_id, then by name only for tracks no shard has by id), then every shard searches its own index with all of the seeds. Each shard's top n
+    per user is merged with a heap into the global top n. Shards that time out or fail are left
+    out of that query, so a slow shard degrades results instead of failing them.
+    """
+
+    def __init__(self, addresses, authkey, timeout=SHARD_TIMEOUT):
+        self.shards = [ShardClient(address, authkey) for address in addresses]
+        self.timeout = timeout
+        self.version = None
+        # Twice the shard count, so a call stuck connecting to a hung shard doesn't hold up the others
+        self._executor = ThreadPoolExecutor(max_workers=2 * len(self.shards), thread_name_prefix="shard")
+
+    def _scatter(self, message, timeout=None, skip=()):
+        """Send a message to every shard not in `skip`.
+
+        Returns the answers of the shards that answered in time, in shard order, and the set of
+        shards that did not.
+        """
+        timeout = self.timeout if timeout is None else timeout
+        futures = {shard_pos: self._executor.submit(shard.call, message, timeout)
+                   for shard_pos, shard in enumerate(self.shards) if shard_pos not in skip}
+        wait(futures.values(), timeout=timeout)
+        results, failed = [], set(skip)
+        for shard_pos, future in futures.items():
+            if not future.done():
+                reason, error = "timeout", f"no answer within {timeout}s"
+            elif future.exception() is not None:
+                error = future.exception()
+                reason = "timeout" if isinstance(error, TimeoutError) else "error"
+            else:
+                results.append(future.result())
+                continue
+            failed.add(shard_pos)
+            inc("shard_failures_total", shard=str(shard_pos), reason=reason)
+            print(f"Shard {shard_pos} left out of {message[0]!r}: {error}")
+        inc("shard_scatters_total", operation=message[0])
+        if not results:
+            raise ShardsUnavailable(f"No shard answered {message[0]!r}")
+        return results, failed
+
+    def status(self):
+        """Health of every shard; also refreshes the combined version reported with results."""
+        futures = [self._executor.submit(shard.call, ("info",), self.timeout) for shard in self.shards]
+        wait(futures, timeout=self.timeout)
+        shards = [future.result() if future.done() and future.exception() is None else None for future in futures]
+        self.version = "+".join((shard["version"] or "-") if shard else "?" for shard in shards)
+        healthy = sum(shard is not None for shard in shards)
+        return {
+            "status": "ok" if healthy == len(shards) else "degraded" if healthy else "down",
+            "version": self.version,
+            "rows": sum(shard["rows"] for shard in shards if shard),
+            "shards": shards,
+        }
+
+    def wait_ready(self, timeout=600.0, interval=0.5):
+        """Block until every shard answers (shards build their index on first start)."""
+        deadline = time.monotonic() + timeout
+        while True:
+            status = self.status()
+            if status["status"] == "ok":
+                return status
+            if time.monotonic() > deadline:
+                raise ShardsUnavailable(f"Only {sum(s is not None for s in status['shards'])} of {len(self.shards)} shards ready")
+            time.sleep(interval)
+
+    @timed("recommend_sharded")
+    def recommend_batch(self, users, n_recommendations=10):
+        """Same contract as recommendation.recommend_batch, answered by the shards."""
+        user_ids = list(users)
+        resolved, failed = self._scatter(("resolve", {pos: users[user_id] for pos, user_id in enumerate(user_ids)}, False))
+        # Name matching only for tracks whose id no shard has, as resolve_seeds does on one index
+        found = {(int(user_pos), track_id) for result in resolved for user_pos, track_id in zip(result[0], result[1])}
+        by_name = {pos: [track for track in users[user_id] if (pos, track.get("id")) not in found]
+                   for pos, user_id in enumerate(user_ids)}
+        by_name = {pos: tracks for pos, tracks in by_name.items() if tracks}
+        if by_name:
+            named, named_failed = self._scatter(("resolve", by_name, True), skip=failed)
+            resolved += named
+            failed |= named_failed
+        seed_user = np.concatenate([result[0] for result in resolved])
+        seed_track_ids = np.concatenate([result[1] for result in resolved])
+
+        by_user = {}
+        if len(seed_user):
+            vectors = np.concatenate([result[2] for result in resolved])
+            seed_weights = np.concatenate([result[3] for result in resolved])
+            # A shard that just missed the first round is skipped rather than waited on again
+            found, _ = self._scatter(("search", seed_user, seed_track_ids, vectors, seed_weights, n_recommendations),
+                                     skip=failed)
+            # Per user, one list per shard of (distance, track_id, track_name, artist_name), closest first
+            for cand_user, *columns in found:
+                users_found, starts = np.unique(cand_user, return_index=True)
+                for user_pos, start, stop in zip(users_found, starts, list(starts[1:]) + [len(cand_user)]):
+                    rows = zip(columns[3][start:stop].tolist(), *(column[start:stop] for column in columns[:3]))
+                    by_user.setdefault(int(user_pos), []).append(rows)
+
+        frames = {}
+        for user_pos, shard_rows in by_user.items():
+            top = list(islice(heapq.merge(*shard_rows, key=lambda row: row[0]), n_recommendations))
+            frames[user_pos] = self._frame(user_ids[user_pos], top)
+
+        # Popularity-based recommendations for users with no matching tracks in any shard
+        matched_users = set(seed_user.tolist())
+        unmatched = [pos for pos in range(len(user_ids)) if pos not in matched_users]
+        inc("recommend_users_total", len(user_ids))
+        if unmatched:
+            inc("recommend_fallback_users_total", len(unmatched))
+            answers, _ = self._scatter(("popular", n_recommendations), skip=failed)
+            per_shard = [zip((-popularity).tolist(), *columns) for popularity, *columns in answers]
+            popular = list(islice(heapq.merge(*per_shard, key=lambda row: row[0]), n_recommendations))
+            for user_pos in unmatched:
+                frames[user_pos] = self._frame(user_ids[user_pos], [(np.nan,) + tuple(row[1:]) for row in popular])
+
+        if not frames:
+            return pd.DataFrame(columns=['user_id', 'rank', 'track_id', 'track_name', 'artist_name', 'distance'])
+        # Users in request order, like recommend_batch
+        return pd.concat([frames[pos] for pos in sorted(frames)], ignore_index=True)
+
+    @staticmethod
+    def _frame(user_id, rows):
+        recs = pd.DataFrame(rows, columns=['distance', 'track_id', 'track_name', 'artist_name'])
+        recs.insert(0, 'rank', np.arange(1, len(recs) + 1))
+        recs.insert(0, 'user_id', user_id)
+        return recs[['user_id', 'rank', 'track_id', 'track_name', 'artist_name', 'distance']]
+
+    def get_recommendations(self, top_tracks, n_recommendations=10):
+        recommendations = self.recommend_batch({"user": top_tracks}, n_recommendations)
+        return recommendations[['track_name', 'artist_name']]
+
+    def close(self):
+        for shard in self.shards:
+            shard.close()
+        self._executor.shutdown(wait=False)
+
+def parse_addresses(value):
+    """'host:port,host:port' -> [(host, port), ...]"""
+    addresses = []
+    for item in value.split(","):
+        host, _, port = item.strip().rpartition(":")
+        addresses.append((host or "127.0.0.1", int(port)))
+    return addresses
+
+def launch_local_shards(n_shards, catalog=None, host="127.0.0.1", base_port=DEFAULT_PORT):
+    """Start n shard_server.py processes on this machine; returns (processes, addresses, authkey).
+
+    Shards read the catalog Parquet files or globs in `catalog`, or the feature group snapshot
+    without it. Uses SHARD_AUTHKEY if it is set, otherwise a random key shared only with the children.
+    """
+    authkey = os.getenv("SHARD_AUTHKEY") or secrets.token_hex(16)
+    env = dict(os.environ, SHARD_AUTHKEY=authkey)
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "shard_server.py")
+    processes, addresses = [], []
+    for shard in range(n_shards):
+        port = base_port + shard
+        processes.append(subprocess.Popen(
+            [sys.executable, script, "--shard", str(shard), "--shards", str(n_shards),
+             "--host", host, "--port", str(port), *(["--catalog", *catalog] if catalog else [])],
+            env=env
+        ))
+        addresses.append((host, port))
+    return processes, addresses, authkey.encode()
+
+def connect(addresses, authkey=None, timeout=SHARD_TIMEOUT):
+    """A coordinator for already running shards, once all of them answer."""
+    coordinator = ShardCoordinator(addresses, authkey or shard_authkey(), timeout)
+    coordinator.wait_ready()
+    return coordinator
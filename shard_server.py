@@ -0,0 +1,241 @@
+import argparse
+import glob
+import os
+import threading
+import zlib
+from multiprocessing.connection import Listener
+import numpy as np
+import pandas as pd
+import time
+import pyarrow.parquet as pq
+from knn_index import (
+    FEATURE_GROUP_NAME,
+    FEATURE_GROUP_VERSION,
+    INDEX_DIR,
+    SELECTED_COLUMNS,
+    build_index,
+    content_hash,
+    is_current
+)
+from feature_pipeline import SOURCE_COLUMNS
+from artifacts import load_current_index, publish_index
+from snapshot_cache import refresh_snapshot, snapshot_parts
+from connections import get_feature_group
+from seed_lookup import lookup_track_ids, resolve_seeds
+from recommendation import _merge_candidates
+from metrics import inc, timed
+
+DEFAULT_PORT = 8601
+# Seconds between re-reads of a shard's rows, so newly ingested tracks get served
+REFRESH_INTERVAL = 600
+READ_BATCH_ROWS = 100_000
+CATALOG_COLUMNS = SELECTED_COLUMNS + [col for col in SOURCE_COLUMNS if col not in SELECTED_COLUMNS]
+
+def shard_of(track_ids, n_shards):
+    """Owning shard of each track_id: crc32 of the id modulo the shard count (stable across processes and hosts)."""
+    return np.array([zlib.crc32(str(track_id).encode()) for track_id in track_ids], dtype=np.int64) % n_shards
+
+def shard_dir(shard, n_shards, root=INDEX_DIR):
+    return os.path.join(root, "shards", f"shard-{shard:03d}-of-{n_shards:03d}")
+
+def read_shard_catalog(paths, shard, n_shards, batch_rows=READ_BATCH_ROWS):
+    """Stream Parquet files and keep only this shard's rows, so no process holds the whole catalog."""
+    parts = []
+    for path in paths:
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=batch_rows, columns=CATALOG_COLUMNS):
+            df = batch.to_pandas()
+            parts.append(df[shard_of(df['track_id'], n_shards) == shard])
+    if not parts:
+        raise ValueError("No catalog files to read")
+    # Later snapshot parts hold newer versions of upserted rows
+    return pd.concat(parts, ignore_index=True).drop_duplicates(subset='track_id', keep='last').reset_index(drop=True)
+
+def read_shard_rows(shard, n_shards, catalog=None, fg_version=FEATURE_GROUP_VERSION):
+    """This shard's rows, from the catalog Parquet files or globs if given.
+
+    Otherwise they come from the local snapshot of the feature group, so tracks ingested through
+    the app are served along with the catalog. The snapshot is only updated incrementally here:
+    a full read would hold the whole catalog in this process, so it must already exist.
+    """
+    if catalog:
+        return read_shard_catalog(sorted(path for pattern in catalog for path in glob.glob(pattern)), shard, n_shards)
+    refresh_snapshot(get_feature_group(FEATURE_GROUP_NAME, fg_version), FEATURE_GROUP_NAME, fg_version,
+                     incremental_only=True)
+    with snapshot_parts(FEATURE_GROUP_NAME, fg_version) as paths:
+        return read_shard_catalog(paths, shard, n_shards)
+
+def load_shard_index(df, shard, n_shards, fg_version=FEATURE_GROUP_VERSION, root=INDEX_DIR, current=None):
+    """This shard's index for its rows: `current` or the published one if it matches them, otherwise built and published."""
+    data_hash = content_hash(df)
+    if is_current(current, fg_version, data_hash):
+        return current
+    index_root = shard_dir(shard, n_shards, root)
+    index = load_current_index(index_root)
+    if not is_current(index, fg_version, data_hash):
+        print(f"Building the index for shard {shard}/{n_shards} ({len(df)} rows).")
+        index = build_index(df, fg_version, data_hash)
+        publish_index(index, index_root)
+    return index
+
+class ShardServer:
+    """Answers a coordinator's seed, neighbour and popularity queries from one shard's index.
+
+    Row ids never leave the shard: seeds travel as embedding vectors and results as track ids,
+    so every shard can be queried with seeds owned by any other shard.
+    """
+
+    def __init__(self, index, shard, n_shards):
+        self.index = index
+        self.shard = shard
+        self.n_shards = n_shards
+
+    def info(self):
+        return {"shard": self.shard, "shards": self.n_shards, "rows": len(self.index["catalog"]),
+                "version": self.index.get("version")}
+
+    def resolve(self, users, by_name=True):
+        """Seeds this shard owns, as (seed_user, track_ids, vectors, weights) for users mapped to track dicts.
+
+        With `by_name=False` only track_ids are matched; the coordinator sends tracks no shard
+        found by id for a second, by-name round, so a shard never matches another shard's track by name.
+        """
+        index = self.index
+        seed_user, seed_rows, seed_weight = [], [], []
+        for user_pos, tracks in users.items():
+            rows, weights = resolve_seeds(index["seed_lookup"], tracks, by_name)
+            seed_user.append(np.full(len(rows), user_pos, dtype=np.int64))
+            seed_rows.append(rows)
+            seed_weight.append(weights)
+        seed_user = np.concatenate(seed_user) if seed_user else np.empty(0, dtype=np.int64)
+        seed_rows = np.concatenate(seed_rows) if seed_rows else np.empty(0, dtype=np.int64)
+        seed_weight = np.concatenate(seed_weight) if seed_weight else np.empty(0, dtype=np.float64)
+        track_ids = index["catalog"].take(seed_rows, ['track_id'])['track_id'].to_numpy(dtype=object)
+        return seed_user, track_ids, np.asarray(index["embedding"][seed_rows], dtype=np.float32), seed_weight
+
+    def search(self, seed_user, seed_track_ids, vectors, seed_weights, n_recommendations):
+        """Each user's top n tracks in this shard, excluding their seeds.
+
+        Distances are divided by the weight of the seed they came from, as in recommend_batch.
+        Returns (user, track_id, track_name, artist_name, distance) arrays grouped by user, closest first.
+        """
+        index = self.index
+        catalog = index["catalog"]
+        n_rows = len(catalog)
+        if not n_rows or not len(seed_user):
+            return (np.empty(0, dtype=np.int64),) + (np.empty(0, dtype=object),) * 3 + (np.empty(0, dtype=np.float32),)
+
+        # A user's own seeds in this shard may come back as neighbours, so ask for that many extra
+        k = min(n_rows, n_recommendations + int(np.bincount(seed_user).max()))
+        with timed("kneighbors"):
+            distances, indices = index["model"].kneighbors(vectors, n_neighbors=k)
+
+        seed_rows = lookup_track_ids(index["seed_lookup"], seed_track_ids)
+        local_user, local_rows = seed_user[seed_rows >= 0], seed_rows[seed_rows >= 0]
+
+        cand_user, cand_row, cand_dist, _ = _merge_candidates(
+            local_user, local_rows, np.repeat(seed_user, k), indices.ravel().astype(np.int64),
+            (distances / seed_weights[:, None]).ravel().astype(np.float32), n_rows, n_recommendations
+        )
+        recs = catalog.take(cand_row)
+        return (cand_user, recs['track_id'].to_numpy(dtype=object), recs['track_name'].to_numpy(dtype=object),
+                recs['artist_name'].to_numpy(dtype=object), cand_dist)
+
+    def popular(self, n):
+        """This shard's n most popular tracks as (popularity, track_id, track_name, artist_name), most popular first."""
+        catalog = self.index["catalog"]
+        rows = catalog.most_popular(n)
+        recs = catalog.take(rows)
+        return (catalog.popularity[rows], recs['track_id'].to_numpy(dtype=object),
+                recs['track_name'].to_numpy(dtype=object), recs['artist_name'].to_numpy(dtype=object))
+
+    def refresh(self, df):
+        """Serve an index of these rows from now on; requests already running keep the old one.
+
+        Returns True if the rows changed.
+        """
+        index = load_shard_index(df, self.shard, self.n_shards, current=self.index)
+        if index is self.index:
+            return False
+        self.index = index
+        inc("shard_index_swaps_total")
+        print(f"Shard {self.shard}/{self.n_shards} now serving {len(index['catalog'])} rows.", flush=True)
+        return True
+
+    def start_refresh(self, catalog=None, interval=REFRESH_INTERVAL):
+        """Re-read this shard's rows every `interval` seconds from a daemon thread."""
+        def run():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.refresh(read_shard_rows(self.shard, self.n_shards, catalog))
+                except Exception as e:
+                    print(f"Failed to refresh shard {self.shard}: {e}")
+
+        if interval > 0:
+            threading.Thread(target=run, name="shard-refresh", daemon=True).start()
+
+    def handle(self, message):
+        operation, *args = message
+        if operation not in ("info", "resolve", "search", "popular"):
+            raise ValueError(f"Unknown operation {operation!r}")
+        inc("shard_requests_total", operation=operation)
+        return getattr(self, operation)(*args)
+
+    def _serve_connection(self, conn):
+        with conn:
+            while True:
+                try:
+                    message = conn.recv()
+                except (EOFError, OSError):
+                    return
+                try:
+                    response = ("ok", self.handle(message))
+                except Exception as e:
+                    response = ("error", f"{type(e).__name__}: {e}")
+                try:
+                    conn.send(response)
+                except OSError:
+                    # The coordinator gave up on this request and closed the connection
+                    return
+
+    def serve_forever(self, address, authkey):
+        """Accept coordinator connections and answer each on its own thread."""
+        with Listener(address, authkey=authkey) as listener:
+            print(f"Shard {self.shard}/{self.n_shards} serving {len(self.index['catalog'])} rows on {address[0]}:{address[1]}",
+                  flush=True)
+            while True:
+                try:
+                    conn = listener.accept()
+                except Exception as e:
+                    # A client with the wrong authkey, or one that disconnected mid-handshake
+                    print(f"Rejected a connection: {e}")
+                    continue
+                threading.Thread(target=self._serve_connection, args=(conn,), daemon=True).start()
+
+def shard_authkey():
+    authkey = os.getenv("SHARD_AUTHKEY")
+    if not authkey:
+        raise ValueError("SHARD_AUTHKEY is not set. Shards and the coordinator must share it.")
+    return authkey.encode()
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve one track_id hash shard of the catalog to a coordinator.")
+    parser.add_argument("--shard", type=int, required=True)
+    parser.add_argument("--shards", type=int, required=True, help="total number of shards")
+    parser.add_argument("--catalog", nargs="+",
+                        help="catalog Parquet files or globs (default: the local snapshot of the feature group)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--refresh-interval", type=float, default=REFRESH_INTERVAL,
+                        help="seconds between re-reads of the shard's rows (0 to disable)")
+    args = parser.parse_args()
+    if not 0 <= args.shard < args.shards:
+        parser.error("--shard must be between 0 and --shards - 1")
+
+    index = load_shard_index(read_shard_rows(args.shard, args.shards, args.catalog), args.shard, args.shards)
+    server = ShardServer(index, args.shard, args.shards)
+    server.start_refresh(args.catalog, args.refresh_interval)
+    server.serve_forever((args.host, args.port), shard_authkey())
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+import fcntl
+import json
+import os
+import time
+from contextlib import contextmanager
+import pandas as pd
+from metrics import inc, timed
+
+SNAPSHOT_DIR = "./snapshots"
+MANIFEST_FILE = "manifest.json"
+LOCK_FILE = ".lock"
+PRIMARY_KEY = "track_id"
+
+# Merge incremental parts back into one file once there are this many
+MAX_PARTS = 16
+
+# Without commit history we can't pull increments, so full re-reads are rate limited
+FULL_READ_MAX_AGE = 3600
+
+def snapshot_path(name, version, snapshot_dir=SNAPSHOT_DIR):
+    """Directory holding the local snapshot of one feature group version."""
+    return os.path.join(snapshot_dir, f"{name}_v{version}")
+
+@contextmanager
+def _locked(path, shared=False):
+    """Hold the snapshot directory's lock file: shared for reads, exclusive for changes.
+
+    flock locks every process (and every thread, since each call opens its own descriptor)
+    that uses the same snapshot, so manifest updates aren't lost and parts aren't deleted
+    while someone reads them.
+    """
+    os.makedirs(path, exist_ok=True)
+    with open(os.path.join(path, LOCK_FILE), "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def _load_manifest(path):
+    manifest_path = os.path.join(path, MANIFEST_FILE)
+    if not os.path.exists(manifest_path):
+        return {"parts": [], "last_commit": None, "updated_at": None}
+    with open(manifest_path) as f:
+        return json.load(f)
+
+def _save_manifest(path, manifest):
+    manifest["updated_at"] = time.time()
+    manifest_path = os.path.join(path, MANIFEST_FILE)
+    tmp_path = manifest_path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f)
+    os.replace(tmp_path, manifest_path)
+
+def _write_part(path, manifest, df):
+    """Write one Parquet part and record it in the manifest."""
+    part_name = f"part-{len(manifest['parts']):05d}-{int(time.time() * 1000)}.parquet"
+    df.to_parquet(os.path.join(path, part_name), index=False)
+    manifest["parts"].append(part_name)
+
+def _latest_commit(feature_group):
+    """Return the newest commit id of a time-travel enabled feature group, or None."""
+    try:
+        commits = feature_group.commit_details(limit=1)
+    except Exception:
+        return None
+    if not commits:
+        return None
+    return max(int(commit_id) for commit_id in commits)
+
+def _read_parts(path, manifest, columns=None):
+    parts = [os.path.join(path, part) for part in manifest["parts"]]
+    if not parts:
+        return None
+    if columns is not None and PRIMARY_KEY not in columns:
+        columns = [PRIMARY_KEY] + list(columns)
+    frames = [pd.read_parquet(part, columns=columns, memory_map=True) for part in parts]
+    df = frames[0] if len(frames) == 1 else pd.concat(frames, ignore_index=True)
+    if len(frames) > 1:
+        # Later parts hold newer versions of upserted rows
+        df = df.drop_duplicates(subset=PRIMARY_KEY, keep="last").reset_index(drop=True)
+    return df
+
+def _compact(path, manifest):
+    df = _read_parts(path, manifest)
+    old_parts = manifest["parts"]
+    manifest["parts"] = []
+    _write_part(path, manifest, df)
+    _save_manifest(path, manifest)
+    for part in old_parts:
+        os.remove(os.path.join(path, part))
+
+def refresh_snapshot(feature_group, name, version, snapshot_dir=SNAPSHOT_DIR, max_age=FULL_READ_MAX_AGE,
+                     incremental_only=False):
+    """Bring the local snapshot up to date, pulling only rows committed since the last refresh.
+
+    With `incremental_only` nothing that loads the whole table into memory is done: no full read
+    (an existing snapshot is kept as it is, a missing one raises ValueError) and no compaction.
+    """
+    path = snapshot_path(name, version, snapshot_dir)
+    with _locked(path):
+        manifest = _load_manifest(path)
+        latest_commit = _latest_commit(feature_group)
+
+        if manifest["parts"] and latest_commit is not None and latest_commit == manifest["last_commit"]:
+            return path
+        if manifest["parts"] and latest_commit is None and time.time() - manifest["updated_at"] < max_age:
+            return path
+
+        if manifest["parts"] and latest_commit is not None and manifest["last_commit"] is not None:
+            # Incremental pull of everything committed after our last refresh
+            with timed("feature_read", mode="incremental"):
+                new_rows = feature_group.as_of(exclude_until=manifest["last_commit"]).read()
+            inc("feature_read_rows_total", len(new_rows), mode="incremental")
+            if not new_rows.empty:
+                _write_part(path, manifest, new_rows)
+        elif incremental_only:
+            if manifest["parts"]:
+                return path
+            raise ValueError(f"No local snapshot of {name} v{version} to update incrementally. Create it with a full "
+                             f"read on a machine that can hold the table (e.g. by running training.py).")
+        else:
+            # First snapshot, or no commit history to diff against: full read
+            old_parts = manifest["parts"]
+            manifest["parts"] = []
+            with timed("feature_read", mode="full"):
+                full = feature_group.read()
+            inc("feature_read_rows_total", len(full), mode="full")
+            _write_part(path, manifest, full)
+            for part in old_parts:
+                os.remove(os.path.join(path, part))
+
+        manifest["last_commit"] = latest_commit
+        _save_manifest(path, manifest)
+
+        if len(manifest["parts"]) > MAX_PARTS and not incremental_only:
+            _compact(path, manifest)
+        return path
+
+def read_snapshot(name, version, columns=None, snapshot_dir=SNAPSHOT_DIR):
+    """Read the local snapshot (memory-mapped), or return None if it doesn't exist yet."""
+    path = snapshot_path(name, version, snapshot_dir)
+    if not os.path.isdir(path):
+        return None
+    with _locked(path, shared=True):
+        return _read_parts(path, _load_manifest(path), columns)
+
+@contextmanager
+def snapshot_parts(name, version, snapshot_dir=SNAPSHOT_DIR):
+    """Paths of the snapshot's Parquet parts, oldest first; they stay on disk while the block runs.
+
+    Rows in later parts replace earlier rows with the same track_id.
+    """
+    path = snapshot_path(name, version, snapshot_dir)
+    if not os.path.isdir(path):
+        yield []
+        return
+    with _locked(path, shared=True):
+        yield [os.path.join(path, part) for part in _load_manifest(path)["parts"]]
+
+def append_snapshot(df, name, version, snapshot_dir=SNAPSHOT_DIR):
+    """Record rows we just inserted so local readers see them before the next refresh."""
+    path = snapshot_path(name, version, snapshot_dir)
+    if not os.path.isdir(path):
+        return
+    with _locked(path):
+        manifest = _load_manifest(path)
+        if not manifest["parts"]:
+            # Nothing to append to; the next refresh will do a full read
+            return
+        _write_part(path, manifest, df)
+        _save_manifest(path, manifest)
+
+def has_snapshot(name, version, snapshot_dir=SNAPSHOT_DIR):
+    """Check whether a local snapshot exists for a feature group version."""
+    return bool(_load_manifest(snapshot_path(name, version, snapshot_dir))["parts"])
+
+def read_feature_group(feature_group, columns=None, refresh=True, snapshot_dir=SNAPSHOT_DIR):
+    """Read a feature group through its local snapshot instead of transferring the full table."""
+    name, version = feature_group.name, feature_group.version
+    if refresh or not has_snapshot(name, version, snapshot_dir):
+        refresh_snapshot(feature_group, name, version, snapshot_dir)
+    with timed("snapshot_read"):
+        return read_snapshot(name, version, columns, snapshot_dir)
@@ -0,0 +1,11 @@
+import os
+import sys
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+@pytest.fixture(autouse=True)
+def repo_cwd(monkeypatch):
+    """Run from the repository root, where the modules look for audio_features_scaler.joblib."""
+    monkeypatch.chdir(ROOT)
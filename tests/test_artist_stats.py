@@ -0,0 +1,106 @@
+import os
+import numpy as np
+import pandas as pd
+import pytest
+import artist_stats
+from artist_stats import ArtistStats, ArtistStatsStore
+
+def _tracks(n=500, seed=0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'artist_name': rng.choice(["A", "B;C", "D", "E"], n),
+        'popularity': rng.integers(0, 100, n).astype(np.float64),
+        'acousticness': rng.random(n),
+        'danceability': rng.random(n),
+        'energy': rng.random(n),
+    })
+
+def test_lookup_matches_pandas_groupby():
+    df = _tracks()
+    stats = ArtistStats()
+    # Added in several batches, like tracks arriving over time
+    for start in range(0, len(df), 70):
+        part = df.iloc[start:start + 70]
+        stats.add(part['artist_name'], part['popularity'], part[['acousticness', 'danceability', 'energy']])
+
+    expected = df.groupby('artist_name').agg(
+        artist_avg_popularity=('popularity', 'mean'),
+        artist_popularity_std=('popularity', 'std'),
+        artist_track_count=('popularity', 'count'),
+        artist_avg_acousticness=('acousticness', 'mean'),
+        artist_avg_danceability=('danceability', 'mean'),
+        artist_avg_energy=('energy', 'mean'),
+    )
+    features = stats.lookup(expected.index).set_index(expected.index)
+    pd.testing.assert_frame_equal(features, expected.astype(features.dtypes), check_exact=False, rtol=1e-9)
+
+def test_single_track_and_unknown_artists_get_zeros():
+    stats = ArtistStats()
+    stats.add(["Solo"], [40.0])
+    features = stats.lookup(["Solo", "Nobody"])
+    assert features.loc[0, 'artist_avg_popularity'] == 40
+    assert features.loc[0, 'artist_popularity_std'] == 0
+    # Tracks without audio features count for popularity only
+    assert features.loc[0, 'artist_avg_energy'] == 0
+    assert (features.loc[1] == 0).all()
+
+def test_spotify_and_catalog_artist_strings_share_a_key():
+    stats = ArtistStats()
+    stats.add(["B;C"], [20.0])
+    stats.add(["B, C"], [60.0])
+    features = stats.lookup(["B;C", "B, C"])
+    assert features['artist_track_count'].tolist() == [2, 2]
+    assert features['artist_avg_popularity'].tolist() == [40, 40]
+
+def test_store_replays_its_log(tmp_path):
+    path = os.path.join(tmp_path, "artist_stats.npz")
+    store = ArtistStatsStore(path)
+    store.replace(ArtistStats())
+    df = _tracks(50)
+    store.add(df['artist_name'], df['popularity'])
+    store.add(["New artist"], [70.0])
+
+    reopened = ArtistStatsStore(path)
+    names = ["A", "B;C", "D", "E", "New artist"]
+    pd.testing.assert_frame_equal(reopened.lookup(names), store.lookup(names))
+    assert reopened.generation == store.generation == 1
+
+def test_store_compacts_without_double_counting(tmp_path, monkeypatch):
+    monkeypatch.setattr(artist_stats, "COMPACT_EVERY", 3)
+    path = os.path.join(tmp_path, "artist_stats.npz")
+    store = ArtistStatsStore(path)
+    for popularity in (10.0, 20.0, 30.0, 40.0):
+        store.add(["A", "B"], [popularity, popularity])
+
+    # Two log lines per add: the second add folds the log into generation 2
+    assert store.generation == 2
+    assert not os.path.exists(f"{path}.1.log")
+    reopened = ArtistStatsStore(path)
+    assert reopened.lookup(["A"])['artist_track_count'].tolist() == [4]
+    assert reopened.lookup(["A"])['artist_avg_popularity'].tolist() == pytest.approx([25])
+
+def test_stores_sharing_a_path_keep_each_others_updates(tmp_path):
+    path = os.path.join(tmp_path, "artist_stats.npz")
+    first = ArtistStatsStore(path)
+    first.replace(ArtistStats())
+    second = ArtistStatsStore(path)
+
+    second.add(["X"], [10.0])
+    # Compacting in one process must neither drop nor repeat the other's logged updates
+    first.save()
+    second.add(["X"], [30.0])
+    first.add(["Y"], [50.0])
+
+    for store in (first, second, ArtistStatsStore(path)):
+        features = store.lookup(["X", "Y"])
+        assert features['artist_track_count'].tolist() == [2, 1]
+        assert features['artist_avg_popularity'].tolist() == pytest.approx([20, 50])
+
+def test_lookup_counts_pending_tracks_without_adding_them():
+    stats = ArtistStats()
+    stats.add(["A"], [20.0])
+    pending = artist_stats.summarize(["A, B", "A"], [60.0, 40.0])
+    features = stats.lookup(["A", "A;B", "C"], pending)
+    assert features['artist_track_count'].tolist() == [2, 1, 0]
+    assert features['artist_avg_popularity'].tolist() == pytest.approx([30, 60, 0])
+    assert stats.lookup(["A"])['artist_track_count'].tolist() == [1]
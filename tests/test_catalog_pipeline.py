@@ -0,0 +1,71 @@
+import glob
+import os
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.preprocessing import StandardScaler
+from feature_pipeline import AUDIO_FEATURES
+from catalog_pipeline import COMMON_COLUMNS, build_catalog
+
+ARTISTS = ["A", "B;C", "Earth, Wind & Fire", "D", None]
+
+def _write_sources(directory, n_sources=3, n_rows=400, seed=0):
+    """Small CSVs shaped like the notebook's sources, with track_ids repeated across them."""
+    rng = np.random.default_rng(seed)
+    paths = []
+    for source in range(n_sources):
+        df = pd.DataFrame({
+            'track_id': [f"id{i}" for i in rng.integers(0, 2 * n_rows, n_rows)],
+            'artists': rng.choice(np.array(ARTISTS, dtype=object), n_rows),
+            'track_name': [f"Track {source}-{i}" for i in range(n_rows)],
+            'album_name': "album",
+            'popularity': rng.integers(0, 100, n_rows),
+            'track_genre': "genre",
+            'duration_ms': rng.integers(100_000, 300_000, n_rows),
+            'key': rng.integers(0, 12, n_rows),
+            'mode': rng.integers(0, 2, n_rows),
+            'time_signature': 4,
+        })
+        for feature in AUDIO_FEATURES:
+            df[feature] = rng.random(n_rows)
+        path = os.path.join(directory, f"source{source}.csv")
+        df.to_csv(path, index=False)
+        paths.append(path)
+    return paths
+
+def _notebook_features(paths):
+    """merge_music_datasets followed by create_features, as in Untitled.ipynb."""
+    merged = pd.concat([pd.read_csv(path).rename(columns={'artists': 'artist_name'})[COMMON_COLUMNS] for path in paths],
+                       ignore_index=True).drop_duplicates(subset='track_id', keep='first')
+    artist_features = merged.groupby('artist_name').agg({
+        'popularity': ['mean', 'std', 'count'],
+        'acousticness': 'mean', 'danceability': 'mean', 'energy': 'mean',
+    })
+    artist_features.columns = [
+        'artist_avg_popularity', 'artist_popularity_std', 'artist_track_count',
+        'artist_avg_acousticness', 'artist_avg_danceability', 'artist_avg_energy',
+    ]
+    df = merged.copy()
+    for column in artist_features.columns:
+        df[column] = df['artist_name'].map(artist_features[column]).fillna(0)
+    df[AUDIO_FEATURES] = StandardScaler().fit_transform(df[AUDIO_FEATURES])
+    df['popularity'] = df['popularity'] / 100
+    return df.set_index('track_id').sort_index()
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_build_catalog_matches_the_notebook(tmp_path, workers):
+    paths = _write_sources(tmp_path)
+    output_dir = os.path.join(tmp_path, "build")
+    shards = build_catalog(paths, output_dir, n_partitions=4, chunk_rows=150, workers=workers)
+
+    assert sorted(shards) == sorted(glob.glob(os.path.join(output_dir, "catalog", "*.parquet")))
+    built = pd.concat([pd.read_parquet(shard) for shard in shards]).set_index('track_id').sort_index()
+    expected = _notebook_features(paths)
+
+    assert built.index.tolist() == expected.index.tolist()
+    assert (built['track_name'] == expected['track_name']).all()
+    assert (built['artist_name'] == expected['artist_name'].fillna("unknown_artist")).all()
+    columns = AUDIO_FEATURES + ['popularity', 'artist_avg_popularity', 'artist_popularity_std', 'artist_track_count',
+                                'artist_avg_acousticness', 'artist_avg_danceability', 'artist_avg_energy']
+    np.testing.assert_allclose(built[columns].to_numpy(dtype=np.float64), expected[columns].to_numpy(dtype=np.float64),
+                               atol=1e-9)
@@ -0,0 +1,25 @@
+import numpy as np
+import pytest
+from benchmark import synthetic_catalog
+from knn_index import build_index
+from neighbour_table import build_neighbour_table
+
+@pytest.fixture(scope="module")
+def index():
+    return build_index(synthetic_catalog(1500))
+
+def test_table_is_identical_across_worker_counts(index):
+    single = build_neighbour_table(index["model"], index["embedding"], 20, workers=1, chunk_rows=256)
+    parallel = build_neighbour_table(index["model"], index["embedding"], 20, workers=3, chunk_rows=256)
+    np.testing.assert_array_equal(single[0], parallel[0])
+    np.testing.assert_array_equal(single[1], parallel[1])
+
+def test_rows_exclude_self_and_match_the_index(index):
+    ids, distances = build_neighbour_table(index["model"], index["embedding"], 20, workers=1)
+    assert ids.shape == (1500, 20)
+    assert not (ids == np.arange(1500)[:, None]).any()
+    assert (np.diff(distances.astype(np.float32), axis=1) >= 0).all()
+
+    # Ask for one extra, since each query track is its own nearest neighbour
+    expected, _ = index["model"].kneighbors(index["embedding"][:50], n_neighbors=21)
+    np.testing.assert_allclose(distances[:50].astype(np.float32), expected[:, 1:], atol=2e-3)
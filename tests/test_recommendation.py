@@ -0,0 +1,65 @@
+import numpy as np
+import pytest
+from benchmark import synthetic_catalog
+from knn_index import build_index
+from recommendation import _merge_candidates, recommend_batch
+
+def test_merge_candidates_drops_seeds_and_keeps_closest_occurrence():
+    # User 0 has seeds 1 and 2; track 3 is reached from both seeds
+    seed_user = np.array([0, 0])
+    seed_rows = np.array([1, 2])
+    cand_user = np.array([0, 0, 0, 0, 0])
+    cand_row = np.array([2, 3, 4, 3, 5])
+    cand_dist = np.array([0.1, 0.5, 0.2, 0.3, 0.9], dtype=np.float32)
+
+    users, rows, dists, ranks = _merge_candidates(seed_user, seed_rows, cand_user, cand_row, cand_dist, 10, 10)
+
+    assert rows.tolist() == [4, 3, 5]
+    assert dists.tolist() == pytest.approx([0.2, 0.3, 0.9])
+    assert users.tolist() == [0, 0, 0]
+    assert ranks.tolist() == [0, 1, 2]
+
+def test_merge_candidates_keeps_users_apart_and_cuts_at_n():
+    # Track 7 is user 1's seed but a fine candidate for user 0
+    seed_user = np.array([0, 1])
+    seed_rows = np.array([1, 7])
+    cand_user = np.array([1, 0, 1, 0, 1, 0])
+    cand_row = np.array([7, 7, 8, 9, 9, 6])
+    cand_dist = np.array([0.0, 0.4, 0.2, 0.1, 0.3, 0.5], dtype=np.float32)
+
+    users, rows, _, ranks = _merge_candidates(seed_user, seed_rows, cand_user, cand_row, cand_dist, 10, 2)
+
+    assert users.tolist() == [0, 0, 1, 1]
+    assert rows.tolist() == [9, 7, 8, 9]
+    assert ranks.tolist() == [0, 1, 0, 1]
+
+@pytest.fixture(scope="module")
+def index():
+    return build_index(synthetic_catalog(2000))
+
+def _users(index, n_users, n_seeds, seed=0):
+    rng = np.random.default_rng(seed)
+    track_ids = index["catalog"].take(np.arange(len(index["catalog"])), ['track_id'])['track_id'].to_numpy()
+    return {f"user{i}": [{"id": track_id} for track_id in rng.choice(track_ids, n_seeds, replace=False)]
+            for i in range(n_users)}
+
+def test_recommend_batch_matches_one_user_at_a_time(index):
+    users = _users(index, 5, 8)
+    batch = recommend_batch(users, 10, index=index)
+    for user_id, tracks in users.items():
+        single = recommend_batch({user_id: tracks}, 10, index=index)
+        assert batch[batch.user_id == user_id].track_id.tolist() == single.track_id.tolist()
+
+def test_recommend_batch_excludes_seeds_and_ranks_by_distance(index):
+    users = _users(index, 3, 5, seed=1)
+    recs = recommend_batch(users, 10, index=index)
+    for user_id, tracks in users.items():
+        user_recs = recs[recs.user_id == user_id]
+        assert user_recs['rank'].tolist() == list(range(1, 11))
+        assert not set(user_recs.track_id) & {track["id"] for track in tracks}
+        assert (np.diff(user_recs.distance.to_numpy()) >= 0).all()
+
+def test_recommend_batch_falls_back_to_popular_tracks(index):
+    recs = recommend_batch({"nobody": [{"id": "not-in-catalog", "name": "nothing", "artists": []}]}, 5, index=index)
+    assert len(recs) == 5
+    assert recs.distance.isna().all()
@@ -0,0 +1,25 @@
+import os
+import numpy as np
+from recommendation_cache import SQLiteResultStore
+
+def _result(n):
+    # 8 bytes per recommendation: an int32 row id and a float32 distance
+    return np.arange(n, dtype=np.int32), np.zeros(n, dtype=np.float32)
+
+def test_trim_drops_least_recently_used_until_bytes_fit(tmp_path):
+    store = SQLiteResultStore(os.path.join(tmp_path, "results.db"), maxbytes=200)
+    for i, n in enumerate([10, 10, 2, 5, 5]):
+        store.set(f"k{i}", "v1", _result(n))
+    # k0 is used again, so k1 is now the least recently used
+    assert store.get("k0") is not None
+    store._trim(0)
+
+    # Dropping k1's 80 bytes brings the 256 down to 176, so k1 is the only entry to go
+    assert [key for key in ("k0", "k1", "k2", "k3", "k4") if store.get(key) is not None] == ["k0", "k2", "k3", "k4"]
+
+def test_trim_keeps_everything_within_the_bound(tmp_path):
+    store = SQLiteResultStore(os.path.join(tmp_path, "results.db"), maxbytes=1000)
+    for i in range(4):
+        store.set(f"k{i}", "v1", _result(10))
+    store._trim(0)
+    assert all(store.get(f"k{i}") is not None for i in range(4))
@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+from benchmark import synthetic_catalog
+from knn_index import build_index
+from recommendation import recommend_batch
+from shard_coordinator import ShardCoordinator
+from shard_server import ShardServer, shard_of
+
+N_SHARDS = 3
+
+class LocalShard:
+    """Stands in for a ShardClient by calling the server in-process."""
+
+    def __init__(self, server):
+        self.server = server
+
+    def call(self, message, timeout):
+        return self.server.handle(message)
+
+    def close(self):
+        pass
+
+@pytest.fixture(scope="module")
+def catalog():
+    df = synthetic_catalog(1500)
+    # Track 1000 shares its name and artist with track 10, which lives on another shard
+    assert shard_of([df.track_id[10]], N_SHARDS) != shard_of([df.track_id[1000]], N_SHARDS)
+    df.loc[1000, ['track_name', 'artist_name']] = df.loc[10, ['track_name', 'artist_name']].to_numpy()
+    return df
+
+@pytest.fixture(scope="module")
+def coordinator(catalog):
+    shards = shard_of(catalog['track_id'], N_SHARDS)
+    # Never connected: the clients are replaced by in-process shards
+    coordinator = ShardCoordinator([("127.0.0.1", 0)] * N_SHARDS, b"", timeout=5)
+    coordinator.shards = [
+        LocalShard(ShardServer(build_index(catalog[shards == shard].reset_index(drop=True)), shard, N_SHARDS))
+        for shard in range(N_SHARDS)
+    ]
+    yield coordinator
+    coordinator.close()
+
+def _tracks(catalog, rows, weights=None):
+    return [{"id": catalog.track_id[row], "name": catalog.track_name[row], "artists": [{"name": catalog.artist_name[row]}],
+             **({"seed_weight": weights[i]} if weights is not None else {})} for i, row in enumerate(rows)]
+
+def test_sharded_results_match_a_single_index(catalog, coordinator):
+    rng = np.random.default_rng(0)
+    missing = {"id": "not-in-catalog", "name": catalog.track_name[20], "artists": [{"name": catalog.artist_name[20]}]}
+    users = {
+        # Seed 10 is found by id on its own shard; another shard's same-named track must not become a seed
+        "duplicate_name": _tracks(catalog, [10, 11, 12]),
+        # Not in the catalog by id, so matched by name
+        "by_name": [missing] + _tracks(catalog, [30]),
+        "weighted": _tracks(catalog, rng.choice(1500, 8, replace=False), rng.uniform(0.1, 2, 8)),
+        **{f"user{i}": _tracks(catalog, rng.choice(1500, 10, replace=False)) for i in range(5)},
+    }
+    single = recommend_batch(users, 10, index=build_index(catalog))
+    sharded = coordinator.recommend_batch(users, 10)
+
+    assert sharded.user_id.tolist() == single.user_id.tolist()
+    assert sharded.track_id.tolist() == single.track_id.tolist()
+    np.testing.assert_allclose(sharded.distance.to_numpy(dtype=float), single.distance.to_numpy(dtype=float), atol=1e-5)
@@ -0,0 +1,49 @@
+from ttl_cache import TTLCache
+
+def _cache(maxbytes):
+    return TTLCache(maxsize=100, ttl=60, maxbytes=maxbytes, sizeof=len)
+
+def test_evicts_least_recently_used_until_bytes_fit():
+    cache = _cache(10)
+    cache.set("a", b"xxxx")
+    cache.set("b", b"xxxx")
+    assert cache.get("a") == b"xxxx"
+    # "b" is now the least recently used, so it goes first
+    cache.set("c", b"xxxx")
+    assert cache.get("b") is None
+    assert cache.get("a") == b"xxxx"
+    assert cache.get("c") == b"xxxx"
+    assert cache.nbytes == 8
+
+def test_replacing_a_key_counts_its_new_size():
+    cache = _cache(10)
+    cache.set("a", b"xxxxxx")
+    cache.set("a", b"xx")
+    assert cache.nbytes == 2
+    cache.set("b", b"xxxxxxxx")
+    assert len(cache) == 2
+    assert cache.nbytes == 10
+
+def test_an_entry_larger_than_the_bound_is_not_kept():
+    cache = _cache(10)
+    cache.set("a", b"xxxx")
+    cache.set("big", b"x" * 11)
+    assert len(cache) == 0
+    assert cache.nbytes == 0
+
+def test_expired_entries_are_dropped_and_release_their_bytes():
+    cache = _cache(10)
+    cache.set("a", b"xxxx", ttl=-1)
+    assert cache.get("a") is None
+    assert cache.nbytes == 0
+    assert (cache.hits, cache.misses) == (0, 1)
+
+def test_pop_and_clear_release_bytes():
+    cache = _cache(10)
+    cache.set("a", b"xxx")
+    cache.set("b", b"xxx")
+    assert cache.pop("a") == b"xxx"
+    assert cache.nbytes == 3
+    cache.clear()
+    assert cache.nbytes == 0
+    assert len(cache) == 0
@@ -0,0 +1,73 @@
+from concurrent.futures import ThreadPoolExecutor
+from ttl_cache import TTLCache
+from playlist import _with_backoff
+from metrics import inc, timed
+
+# How much a track counts towards the seed set for each window it's in
+TIME_RANGE_WEIGHTS = {"short_term": 1.0, "medium_term": 0.6, "long_term": 0.3}
+# Spotify serves at most 50 top tracks per page and 100 per time range
+PAGE_LIMIT = 50
+TRACKS_PER_RANGE = 100
+# Seeds handed to the recommender; each one adds a neighbour list to merge. With the default
+# 10 recommendations, 40 seeds fit within a 50-deep neighbour table row
+# (neighbour_table.NEIGHBOUR_TABLE_SIZE), so no seed needs a live index query
+MAX_SEEDS = 40
+TOP_TRACKS_TTL = 600
+
+# (user_id, time_range) -> that window's top tracks, shared by all sessions
+_top_tracks_cache = TTLCache(maxsize=10_000, ttl=TOP_TRACKS_TTL)
+
+def _fetch_page(spotify_client, time_range, offset, limit):
+    with timed("spotify_fetch"):
+        results = _with_backoff(spotify_client.current_user_top_tracks, limit=limit, offset=offset, time_range=time_range)
+    return results["items"]
+
+def fetch_time_ranges(spotify_client, time_ranges=tuple(TIME_RANGE_WEIGHTS), per_range=TRACKS_PER_RANGE, user_id=None):
+    """Fetch the user's top tracks for each time range; returns {time_range: [track, ...]}.
+
+    Every page of every uncached window is requested at once, so the wall-clock cost is about
+    one API call. With `user_id` the windows are cached for TOP_TRACKS_TTL seconds.
+    """
+    windows, pages = {}, []
+    for time_range in time_ranges:
+        cached = _top_tracks_cache.get((user_id, time_range)) if user_id is not None else None
+        if cached is not None:
+            inc("spotify_top_tracks_cache_hits_total")
+            windows[time_range] = cached
+            continue
+        inc("spotify_top_tracks_cache_misses_total")
+        pages.extend((time_range, offset, min(PAGE_LIMIT, per_range - offset)) for offset in range(0, per_range, PAGE_LIMIT))
+
+    if pages:
+        with ThreadPoolExecutor(max_workers=len(pages)) as executor:
+            results = list(executor.map(lambda page: _fetch_page(spotify_client, *page), pages))
+        fetched = {}
+        # Pages come back in request order, so each window's tracks stay in rank order
+        for (time_range, _, _), items in zip(pages, results):
+            fetched.setdefault(time_range, []).extend(items)
+        for time_range, items in fetched.items():
+            windows[time_range] = items
+            if user_id is not None:
+                _top_tracks_cache.set((user_id, time_range), items)
+    return {time_range: windows[time_range] for time_range in time_ranges}
+
+def merge_seed_tracks(windows, weights=TIME_RANGE_WEIGHTS, max_seeds=MAX_SEEDS):
+    """Merge per-window top tracks into one seed list, highest weight first.
+
+    A track scores its window's weight scaled down linearly with its rank in that window, summed
+    over every window it appears in, so tracks that are both recent favourites and long-time
+    favourites come first. Each returned track is a copy with its score as `seed_weight`.
+    """
+    scores, tracks = {}, {}
+    for time_range, items in windows.items():
+        for position, track in enumerate(items):
+            track_id = track["id"]
+            scores[track_id] = scores.get(track_id, 0.0) + weights[time_range] * (1 - position / len(items))
+            tracks.setdefault(track_id, track)
+    # sorted() is stable, so ties keep the order tracks were first seen in
+    ranked = sorted(scores, key=lambda track_id: -scores[track_id])[:max_seeds]
+    return [dict(tracks[track_id], seed_weight=round(scores[track_id], 6)) for track_id in ranked]
+
+def fetch_seed_tracks(spotify_client, user_id=None, max_seeds=MAX_SEEDS, per_range=TRACKS_PER_RANGE):
+    """Fetch short, medium and long term top tracks concurrently and merge them into weighted seeds."""
+    return merge_seed_tracks(fetch_time_ranges(spotify_client, per_range=per_range, user_id=user_id), max_seeds=max_seeds)
@@ -1,14 +1,23 @@
-import pandas as pd
-from sklearn.preprocessing import LabelEncoder
-from sklearn.neighbors import NearestNeighbors
+import argparse
 from dotenv import load_dotenv
 import hopsworks
 import os
-import joblib
+from knn_index import (
+    FEATURE_GROUP_NAME,
+    FEATURE_GROUP_VERSION,
+    INDEX_DIR,
+    N_NEIGHBORS,
+    attach_neighbour_table,
+    build_index,
+    content_hash,
+    is_current
+)
+from artifacts import load_current_index, publish_index
+from snapshot_cache import read_feature_group
 
 load_dotenv()
 
-def main():
+def main(workers=None):
     hopsworks_api_key = os.getenv("HOPSWORKS_API_KEY")
     os.environ["HOPSWORKS_API_KEY"] = hopsworks_api_key
     
@@ -22,65 +31,60 @@ def main():
     # Retrieve feature group
     fs = project.get_feature_store()
     try:
-        spotify_features = fs.get_feature_group(name="recommender_spotify", version=2)
-        df = spotify_features.read()
+        spotify_features = fs.get_feature_group(name=FEATURE_GROUP_NAME, version=FEATURE_GROUP_VERSION)
+        df = read_feature_group(spotify_features)
     except Exception as e:
         print(f"Failed to retrieve feature group: {e}")
         return
     
-    # Select and encode features
-    selected_columns = ['popularity', 'artist_name', 'track_name']
-    training_data = df[selected_columns].copy()
-    
-    label_encoder_artist = LabelEncoder()
-    label_encoder_track = LabelEncoder()
-    training_data['artist_encoded'] = label_encoder_artist.fit_transform(training_data['artist_name'])
-    training_data['track_encoded'] = label_encoder_track.fit_transform(training_data['track_name'])
-    
-    features = ['popularity', 'artist_encoded', 'track_encoded']
-    X = training_data[features]
-    
-    # Train KNN model
-    knn_model = NearestNeighbors(n_neighbors=10, metric='cosine')
-    knn_model.fit(X)  
-    
-    # Save the model
-    model_dir = "./knn_model"
-    os.makedirs(model_dir, exist_ok=True)
-    model_path = os.path.join(model_dir, "knn_model.pkl")
-    joblib.dump(knn_model, model_path)
+    # Skip the refit if the current published index was built from identical data
+    data_hash = content_hash(df)
+    index = load_current_index()
+    if (is_current(index, FEATURE_GROUP_VERSION, data_hash) and index.get("neighbour_table") is not None
+            and index.get("version")):
+        print(f"Catalog unchanged since the last build. Keeping index version {index.get('version')}.")
+        return
+
+    # Build the audio embedding and train KNN model
+    if not is_current(index, FEATURE_GROUP_VERSION, data_hash):
+        index = build_index(df, FEATURE_GROUP_VERSION, data_hash)
 
-    # Register model to Hopsworks
+    # Precompute per-track neighbours so serving is mostly table lookups
+    attach_neighbour_table(index, workers=workers)
+    version = publish_index(index)
+    print(f"Published index version {version}. Running apps pick it up on their next poll.")
+
+    X = index["embedding"]
+    model_dir = os.path.join(INDEX_DIR, version)
+
+    # Register every published bundle as a new version of the model
     try:
         mr = project.get_model_registry()
         model_name = "knn_recommendation_model_2"
-        
-        # Check if the model already exists
-        try:
-            existing_model = mr.get_model(name=model_name)
-            print(f"Model '{model_name}' already exists in the Model Registry. Skipping registration.")
-        except Exception as e:
-            # Assuming that an exception is raised if the model does not exist
-            print(f"Model '{model_name}' does not exist. Proceeding to register the model.")
-            
-            metrics = {
-                "Number of neighbors": 10,
-            }
-            
-            knn_recommendation_model = mr.python.create_model(
-                name=model_name,       
-                metrics=metrics,                       
-                input_example=X.iloc[0].values,        
-                description=(
-                    "Content-based recommendation model using KNN. "
-                    "This model uses cosine distance with 10 neighbors."
-                ),
-            )
-            
-            knn_recommendation_model.save(model_dir)
-            print("KNN recommendation model has been saved to Hopsworks!")
+
+        metrics = {
+            "Number of neighbors": N_NEIGHBORS,
+            "Catalog rows": len(index["catalog"]),
+        }
+
+        knn_recommendation_model = mr.python.create_model(
+            name=model_name,
+            metrics=metrics,
+            input_example=X[0],
+            description=(
+                "Content-based recommendation model using KNN over scaled audio features. "
+                f"This model uses cosine distance with 10 neighbors. Index bundle {version}."
+            ),
+        )
+
+        knn_recommendation_model.save(model_dir)
+        print(f"KNN recommendation model version {knn_recommendation_model.version} has been saved to Hopsworks!")
     except Exception as e:
         print(f"Failed to register the model: {e}")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Build the KNN index bundle and register it in Hopsworks.")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="processes for the neighbour table build (default: all cores); the output is the same for any value")
+    args = parser.parse_args()
+    main(workers=args.workers)
@@ -0,0 +1,63 @@
+import threading
+import time
+from collections import OrderedDict
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries also expire after `ttl` seconds.
+
+    With `maxbytes` set, entries are also evicted least recently used first until the summed
+    `sizeof(value)` of what's left fits.
+    """
+
+    def __init__(self, maxsize=1024, ttl=3600, maxbytes=None, sizeof=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.maxbytes = maxbytes
+        self.sizeof = sizeof or (lambda value: 0)
+        self.hits = 0
+        self.misses = 0
+        self.nbytes = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _remove(self, key):
+        self.nbytes -= self._data.pop(key)[2]
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    self._remove(key)
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        size = self.sizeof(value)
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+            self._data[key] = (expires_at, value, size)
+            self.nbytes += size
+            while self._data and (len(self._data) > self.maxsize
+                                  or (self.maxbytes is not None and self.nbytes > self.maxbytes)):
+                self._remove(next(iter(self._data)))
+
+    def pop(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                self._remove(key)
+        return default if entry is None else entry[1]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.nbytes = 0
+
+    def __len__(self):
+        return len(self._data)